@@ -15,7 +15,7 @@ from pipelines.sentiment import detect_sentiment
 from pipelines.story_gen import generate_story
 from pipelines.image_gen import generate_image                # local SD/SDXL fallback
 from pipelines.cloud_image import generate_image_cloud        # cloud (Stability v2beta)
-from pipelines.tts import tts_to_file
+from pipelines.tts import tts_to_file, story_narration_path, audio_mime
 from pipelines.pdf import build_pdf, build_pdf_from_scenes
 from pipelines.scene_plan import plan_scenes
 from utils.prompt_templates import story_user_prompt, image_prompt_from_scene
@@ -185,13 +185,9 @@ if MODE == "Create":
     if go:
         seed_text = ""
         if ss.get("rec_bytes"):
-            tmp = Path("data/tmp_recorded.wav"); tmp.parent.mkdir(parents=True, exist_ok=True)
-            tmp.write_bytes(ss["rec_bytes"])
-            seed_text = transcribe_audio(str(tmp), model_size=STT_MODEL, compute_type=STT_PREC, device="cpu")
+            seed_text = transcribe_audio(ss["rec_bytes"], model_size=STT_MODEL, compute_type=STT_PREC, device="cpu")
         elif uploaded_audio is not None:
-            tmp = Path("data/tmp_uploaded"); tmp.parent.mkdir(parents=True, exist_ok=True)
-            tmp.write_bytes(uploaded_audio.read())
-            seed_text = transcribe_audio(str(tmp), model_size=STT_MODEL, compute_type=STT_PREC, device="cpu")
+            seed_text = transcribe_audio(uploaded_audio.getvalue(), model_size=STT_MODEL, compute_type=STT_PREC, device="cpu")
         else:
             seed_text = (text_seed or "").strip()
 
@@ -225,9 +221,11 @@ if MODE == "Create":
             st.markdown("</div>", unsafe_allow_html=True)
 
         with colB:
-            if st.button("🔊 Read Aloud (save WAV)"):
-                out_audio = Path("data/audio/story.wav"); out_audio.parent.mkdir(parents=True, exist_ok=True)
-                tts_to_file(ss.story, str(out_audio)); st.audio(str(out_audio))
+            if st.button("🔊 Read Aloud"):
+                out_audio = story_narration_path(ss.story)
+                if not out_audio.exists():
+                    tts_to_file(ss.story, str(out_audio))
+                st.audio(str(out_audio), format=audio_mime(str(out_audio)))
                 st.success(f"Saved narration → {out_audio}")
 
             if ss.image_path and Path(ss.image_path).exists():
@@ -1,6 +1,7 @@
 # app/pages/1_Create_Story.py
 import os
 from pathlib import Path
+from dataclasses import asdict
 from datetime import datetime
 
 import streamlit as st
@@ -10,16 +11,18 @@ from audio_recorder_streamlit import audio_recorder
 from ui_shared import inject_css, init_state, split_paragraphs, top_nav
 
 # Pipelines
-from pipelines.stt import transcribe_audio
+from pipelines.stt import transcribe_audio, last_transcription_stats, STT_LANGUAGE
 from pipelines.sentiment import detect_sentiment
-from pipelines.story_gen import generate_story
+from pipelines.story_gen import generate_story_stream
 from pipelines.image_gen import generate_image                  # local (SD/SDXL)
 from pipelines.cloud_image import generate_image_cloud          # cloud (Stability)
-from pipelines.tts import tts_to_file
-from pipelines.pdf import build_pdf, build_pdf_from_scenes
-from pipelines.scene_plan import plan_scenes
+from pipelines.tts import narrate_stream, story_narration_path, audio_mime
+from pipelines.pdf import build_pdf
+from pipelines.book import BookOptions                          # plan -> images/narration -> PDF
+from pipelines import background                                # registers background job handlers
 from utils.prompt_templates import story_user_prompt, image_prompt_from_scene
 from utils.library import save_snapshot
+from utils.jobs import submit, poll, cancel, list_jobs, FINISHED
 
 
 # ------------------------------------------------------------------
@@ -36,6 +39,8 @@ with st.sidebar.expander("Advanced settings", expanded=False):
     MODEL_HINT = st.text_input("Local GGUF path (fallback)", DEFAULT_GGUF)
 
     USE_CLOUD_LLM = st.checkbox("Use Cloud LLM (Gemini)", value=True)
+    REUSE_LLM = st.checkbox("Reuse cached LLM replies", value=True,
+                            help="Untick to get a fresh story / scene plan for the same input.")
     USE_CLOUD_IMG = st.checkbox("Use Cloud Images (Stability)", value=True)
 
     IMG_MODEL = st.selectbox(
@@ -44,11 +49,23 @@ with st.sidebar.expander("Advanced settings", expanded=False):
         help="Used only if cloud image gen is off or fails.",
     )
     STEPS = st.slider("Image steps", 4, 30, 6, step=1)
+    REGEN_IMAGES = st.checkbox("Regenerate images (skip cache)", value=False,
+                               help="Ignore previously generated illustrations for the same prompt.")
 
     STT_MODEL = st.selectbox("STT model (Whisper)", ["tiny", "base", "small", "medium", "large-v3"], index=2)
     STT_PREC  = st.selectbox("STT precision", ["int8", "int8_float16", "float16", "float32"], index=0)
+    STT_PROFILE = st.selectbox(
+        "STT decoding", ["fast", "accurate", "words"], index=0,
+        format_func={"fast": f"Fast (greedy, {STT_LANGUAGE or 'auto language'})",
+                     "accurate": "Accurate (beam search, any language)",
+                     "words": "Accurate + word timestamps"}.get,
+        help="Fast suits short spoken prompts; Accurate for long or noisy recordings. "
+             "Set STT_LANGUAGE (e.g. en) to skip language detection in Fast mode.",
+    )
 
     NUM_SCENES = st.slider("Number of scenes", 4, 8, 6)
+    NARRATE_SCENES = st.checkbox("Narrate each scene", value=True,
+                                 help="Produce Book also records a WAV per scene caption.")
 
 # =================== Input Tabs ===================
 tab1, tab2, tab3 = st.tabs(["✍️ Type a prompt", "📁 Upload audio", "🎙️ Record audio"])
@@ -72,6 +89,8 @@ with tab3:
         st.success("Recording cleared.")
 
 # =================== Action Row ===================
+# One book at a time per session: Produce Book stays off while this session's book job is pending
+book_busy = any(job and job["kind"] == "book" and job["status"] not in FINISHED for job in map(poll, ss.jobs))
 col1, col2, col3, col4 = st.columns(4)
 with col1:
     go = st.button("✨ Generate Story", type="primary")
@@ -80,20 +99,87 @@ with col2:
 with col3:
     pdf_go = st.button("📄 Build PDF")
 with col4:
-    book_go = st.button("📘 Produce Book")
+    book_go = st.button("📘 Produce Book", disabled=book_busy,
+                        help="A book is already being produced." if book_busy else None)
+
+# =================== Background jobs ===================
+def apply_book_result(res: dict):
+    ss.scenes = res.get("scenes") or []
+    ss.page_idx = 0
+    if res.get("pdf_path"):
+        ss.last_scene_pdf = res["pdf_path"]  # remember latest
+    ss.last_book_timings = res.get("timings")
+
+# Attach results of jobs that finished since the last run
+for jid in list(ss.jobs):
+    job = poll(jid)
+    if job is None or job["status"] not in FINISHED:
+        continue
+    ss.jobs.remove(jid)
+    if job["status"] == "done" and job["kind"] == "book":
+        apply_book_result(job["result"])
+        st.success(f"Book ready: {len(ss.scenes)} scenes.")
+        if ss.get("last_scene_pdf") and Path(ss.last_scene_pdf).exists():
+            with open(ss.last_scene_pdf, "rb") as f:
+                st.download_button("⬇️ Download Scene Book", data=f, file_name=Path(ss.last_scene_pdf).name,
+                                   mime="application/pdf", key=f"dl_job_{jid}")
+        with st.expander("Stage timings", expanded=False):
+            st.json(ss.last_book_timings or {})
+    elif job["status"] == "failed":
+        st.error(f"Background {job['kind']} job failed: {job['error']}")
+    else:
+        st.info(f"Background {job['kind']} job cancelled.")
+
+@st.fragment(run_every=2)
+def job_panel():
+    for jid in list(ss.jobs):
+        job = poll(jid)
+        if job is None:
+            continue
+        if job["status"] in FINISHED:
+            st.rerun()      # full rerun attaches the result above
+        c1, c2 = st.columns([5, 1])
+        with c1:
+            st.progress(job["progress"], text=f"{job['kind'].title()}: {job['message'] or job['status']}…")
+        with c2:
+            if st.button("✖ Cancel", key=f"cancel_{jid}"):
+                cancel(jid)
+
+if ss.jobs:
+    job_panel()
+
+with st.expander("Recent books", expanded=False):
+    # The job table is shared by every browser session: only list books this session produced
+    recent = list_jobs(kind="book", status="done", owner=ss.session_id, limit=5)
+    if not recent:
+        st.caption("Books you finish appear here, even after switching pages.")
+    for job in recent:
+        r1, r2 = st.columns([5, 1])
+        with r1:
+            st.write(f"**{job['params']['options'].get('title', 'Untitled')}** · "
+                     f"{datetime.fromtimestamp(job['finished_at']).strftime('%Y-%m-%d %H:%M')} · "
+                     f"{len(job['result'].get('scenes') or [])} scenes")
+        with r2:
+            if st.button("Open", key=f"open_job_{job['id']}"):
+                ss.story = job["params"]["story"]
+                ss.title = job["params"]["options"].get("title", ss.title)
+                apply_book_result(job["result"])
+                st.rerun()
 
 # =================== Generate Story ===================
 if go:
     seed_text = ""
-    if ss.get("rec_bytes"):
-        tmp = Path("data/tmp_recorded.wav"); tmp.parent.mkdir(parents=True, exist_ok=True)
-        tmp.write_bytes(ss["rec_bytes"])
-        seed_text = transcribe_audio(str(tmp), model_size=STT_MODEL, compute_type=STT_PREC, device="cpu")
-    elif uploaded_audio is not None:
-        ext = Path(uploaded_audio.name).suffix or ".wav"
-        tmp = Path(f"data/tmp_uploaded{ext}"); tmp.parent.mkdir(parents=True, exist_ok=True)
-        tmp.write_bytes(uploaded_audio.read())
-        seed_text = transcribe_audio(str(tmp), model_size=STT_MODEL, compute_type=STT_PREC, device="cpu")
+    # Audio is decoded straight from memory; no temp files
+    audio_in = ss.get("rec_bytes") or (uploaded_audio.getvalue() if uploaded_audio is not None else None)
+    if audio_in:
+        seed_text = transcribe_audio(audio_in, model_size=STT_MODEL, compute_type=STT_PREC, device="cpu",
+                                     profile=STT_PROFILE)
+        stt = last_transcription_stats()
+        st.caption(f"🎙️ “{seed_text}” — {stt['audio_s']:.1f}s of audio transcribed in {stt['seconds']:.2f}s "
+                   f"(real-time factor {stt['rtf']:.2f}, {stt['profile']}, {stt['language']})")
+        if stt["words"]:
+            with st.expander("Word timings"):
+                st.dataframe(stt["words"], use_container_width=True, hide_index=True)
     else:
         seed_text = (text_seed or "").strip()
 
@@ -102,8 +188,15 @@ if go:
     else:
         sentiment = detect_sentiment(seed_text)
         user_prompt = story_user_prompt(seed_text, sentiment)
-        story = generate_story(user_prompt, gguf_path=MODEL_HINT if MODEL_HINT else None, prefer_cloud=USE_CLOUD_LLM)
-        ss.story = story
+        # Render the story as it is written; the card below takes over once done
+        live = st.empty()
+        with live.container():
+            story = st.write_stream(generate_story_stream(
+                user_prompt, gguf_path=MODEL_HINT if MODEL_HINT else None,
+                prefer_cloud=USE_CLOUD_LLM, use_cache=REUSE_LLM,
+            ))
+        live.empty()
+        ss.story = (story or "").strip()
         ss.title = "Story about " + (seed_text[:40] + ("..." if len(seed_text) > 40 else ""))
         ss.scenes = []
         ss.page_idx = 0
@@ -127,10 +220,17 @@ if ss.story:
         st.markdown("</div>", unsafe_allow_html=True)
 
     with right:
-        if st.button("🔊 Read Aloud (save WAV)"):
-            out_audio = Path("data/audio/story.wav"); out_audio.parent.mkdir(parents=True, exist_ok=True)
-            tts_to_file(ss.story, str(out_audio)); st.audio(str(out_audio))
-            st.success(f"Saved narration → {out_audio}")
+        # Narration is kept per story (named by its text) and compressed
+        narration = story_narration_path(ss.story)
+        if not narration.exists() and st.button("🔊 Read Aloud"):
+            with st.spinner("Narrating…"):
+                for i, seg in enumerate(narrate_stream(split_paragraphs(ss.story), str(narration))):
+                    if i == 0:
+                        # first paragraph is playable while the rest is still rendering
+                        st.caption("First paragraph")
+                        st.audio(seg, format=audio_mime(seg))
+        if narration.exists():
+            st.audio(str(narration), format=audio_mime(str(narration)))
 
         if ss.image_path and Path(ss.image_path).exists():
             st.image(ss.image_path, caption="Illustration", use_container_width=True)
@@ -147,10 +247,12 @@ if img_go:
 
         img_path = None
         if USE_CLOUD_IMG:
-            img_path = generate_image_cloud(img_prompt, str(out_img), steps=STEPS or 12)
+            img_path = generate_image_cloud(img_prompt, str(out_img), steps=STEPS or 12,
+                                            use_cache=not REGEN_IMAGES)
         if not img_path:
             chosen = None if IMG_MODEL == "auto" else IMG_MODEL
-            img_path = generate_image(img_prompt, str(out_img), model_id=chosen, steps=STEPS)
+            img_path = generate_image(img_prompt, str(out_img), model_id=chosen, steps=STEPS,
+                                      use_cache=not REGEN_IMAGES)
 
         ss.image_path = img_path
         st.success(f"Image generated → {img_path}")
@@ -186,32 +288,12 @@ if book_go:
     if not ss.story:
         st.warning("Generate a story first.")
     else:
-        with st.status("Planning scenes…", expanded=True):
-            ss.scenes = plan_scenes(ss.story, num_scenes=NUM_SCENES, prefer_cloud=True)
-            ss.page_idx = 0
-            st.write(f"Planned {len(ss.scenes)} scenes.")
-
-        prog = st.progress(0, text="Generating images…")
-        for i, sc in enumerate(ss.scenes, 1):
-            base = sc.get("image_prompt") or image_prompt_from_scene(sc["caption"])
-            img_prompt = f"No text on the image. {base}"
-            out_img = Path(f"data/images/scene_{i:02d}.png"); out_img.parent.mkdir(parents=True, exist_ok=True)
-
-            img_path = None
-            if USE_CLOUD_IMG:
-                img_path = generate_image_cloud(img_prompt, str(out_img), steps=STEPS or 12)
-            if not img_path:
-                chosen = None if IMG_MODEL == "auto" else IMG_MODEL
-                img_path = generate_image(img_prompt, str(out_img), model_id=chosen, steps=STEPS)
-
-            sc["image_path"] = img_path
-            prog.progress(i / max(1, len(ss.scenes)))
-        prog.empty()
-
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_pdf = Path(f"data/pdfs/storybook_scenes_{ts}.pdf")
-        build_pdf_from_scenes(ss.title, ss.scenes, str(out_pdf))
-        ss.last_scene_pdf = str(out_pdf)  # remember latest
-        st.success(f"PDF saved → {out_pdf}")
-        with open(out_pdf, "rb") as f:
-            st.download_button("⬇️ Download Scene Book", data=f, file_name=out_pdf.name, mime="application/pdf")
+        # Plan, illustrations, narration and PDF run as one stage graph in a background job,
+        # so reruns and page switches don't throw the work away
+        opts = BookOptions(
+            title=ss.title, num_scenes=NUM_SCENES, use_cloud_img=USE_CLOUD_IMG,
+            img_model=None if IMG_MODEL == "auto" else IMG_MODEL, steps=STEPS,
+            narrate=NARRATE_SCENES, use_llm_cache=REUSE_LLM, use_image_cache=not REGEN_IMAGES,
+        )
+        ss.jobs.append(submit("book", {"story": ss.story, "options": asdict(opts)}, owner=ss.session_id))
+        st.rerun()
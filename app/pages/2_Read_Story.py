@@ -3,6 +3,7 @@ from pathlib import Path
 
 import streamlit as st
 from ui_shared import inject_css, init_state, split_paragraphs, top_nav, READ_MODE_IMG_WIDTH
+from utils.thumbs import best_image
 
 inject_css()
 ss = init_state()
@@ -33,7 +34,7 @@ if ss.get("scenes"):
     with left:
         st.markdown('<div class="page-card">', unsafe_allow_html=True)
         if sc.get("image_path") and Path(sc["image_path"]).exists():
-            st.image(sc["image_path"], width=READ_MODE_IMG_WIDTH)
+            st.image(best_image(sc["image_path"], READ_MODE_IMG_WIDTH), width=READ_MODE_IMG_WIDTH)
         else:
             st.info("Image not available for this page.")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -79,12 +80,10 @@ if ss.get("scenes"):
                                 key=f"dl_scene_read_{Path(last_scene).name}")
 
     with col2:
-        # Always rebuild the Story PDF from the CURRENT story before offering download
-        from pipelines.pdf import build_pdf
-        tmp_latest = Path("data/pdfs/storybook_latest.pdf")
+        # Story PDF for the CURRENT story; only rebuilt when title, text or images change
+        from pipelines.pdf import cached_build_pdf, pdf_bytes
         imgs = [ss.image_path] if ss.image_path and Path(ss.image_path).exists() else []
-        build_pdf(ss.title, ss.story, imgs, str(tmp_latest))
-        with open(tmp_latest, "rb") as f:
-            st.download_button("⬇️ Download Story PDF", data=f,
-                            file_name="storybook.pdf", mime="application/pdf",
-                            key="dl_story_read_latest")
+        story_pdf = cached_build_pdf(ss.title, ss.story, imgs)
+        st.download_button("⬇️ Download Story PDF", data=pdf_bytes(story_pdf),
+                        file_name="storybook.pdf", mime="application/pdf",
+                        key="dl_story_read_latest")
@@ -2,8 +2,9 @@
 from pathlib import Path
 import streamlit as st
 
-from ui_shared import inject_css, init_state, top_nav
-from utils.library import list_entries, load_entry_to_session
+from ui_shared import inject_css, init_state, top_nav, LIBRARY_CARD_WIDTH
+from utils.library import list_entries, load_entry_to_session, page_cursor, search_entries, story_pdf_path
+from utils.thumbs import best_image
 
 inject_css()
 ss = init_state()
@@ -11,10 +12,9 @@ top_nav("Library")
 
 st.title("🗂️ Library")
 
-entries = list_entries(limit=30)
-if not entries:
-    st.info("No saved stories yet. Create one on the **Create** page, then click **Save to Library**.")
-else:
+PAGE_SIZE = 30
+
+def render_grid(entries):
     cols = st.columns(3)
     for i, e in enumerate(entries):
         with cols[i % 3]:
@@ -23,11 +23,13 @@ else:
             cover = e.get("cover_image")
             folder = Path(e["_folder"])
             if cover and (folder / cover).exists():
-                st.image(str(folder / cover), use_container_width=True)
+                st.image(best_image(str(folder / cover), LIBRARY_CARD_WIDTH), use_container_width=True)
             else:
                 st.write("*(No cover image)*")
             st.subheader(e.get("title", "Untitled"))
             st.caption(f"Created: {e.get('created_at','')} · ID: `{e.get('id','')}`")
+            if e.get("_snippet"):
+                st.markdown(f"> {e['_snippet']}")
 
             btn_read = st.button("📖 Read", key=f"read_{e['id']}")
             if btn_read:
@@ -43,3 +45,54 @@ else:
             if last_story_pdf and (folder / last_story_pdf).exists():
                 with open(folder / last_story_pdf, "rb") as f:
                     st.download_button("⬇️ Story PDF", data=f, file_name=(folder / last_story_pdf).name, mime="application/pdf", key=f"dl_story_{e['id']}")
+            elif e.get("story_pdf_recipe"):
+                # Story PDFs are built on first request, then kept with the entry
+                if st.button("📄 Prepare Story PDF", key=f"mk_story_{e['id']}"):
+                    with st.spinner("Laying out PDF…"):
+                        ok = story_pdf_path(e["id"])
+                    if ok:
+                        st.rerun()
+                    st.error("Could not build the PDF for this story.")
+
+query = st.text_input(
+    "🔎 Search stories",
+    key="lib_query",
+    placeholder='Words match as prefixes (drag → dragon); use "quotes" for exact phrases',
+)
+
+if query.strip():
+    hits = search_entries(query, limit=PAGE_SIZE)
+    if not hits:
+        st.info("No stories match that search.")
+    else:
+        st.caption(f"{len(hits)} best match{'es' if len(hits) != 1 else ''}, most relevant first")
+        render_grid(hits)
+    st.stop()
+
+# Keyset pagination: stack of "before" cursors, one per page visited
+ss.setdefault("lib_cursors", [None])
+entries = list_entries(limit=PAGE_SIZE + 1, before=ss.lib_cursors[-1])
+has_older = len(entries) > PAGE_SIZE
+entries = entries[:PAGE_SIZE]
+
+if not entries and len(ss.lib_cursors) == 1:
+    st.info("No saved stories yet. Create one on the **Create** page, then click **Save to Library**.")
+else:
+    render_grid(entries)
+
+    # ---- Paging ----
+    st.markdown("----")
+    p1, p2, p3 = st.columns([1, 2, 1])
+    with p1:
+        if st.button("← Newer", disabled=len(ss.lib_cursors) == 1, key="lib_newer"):
+            ss.lib_cursors.pop()
+            st.rerun()
+    with p2:
+        st.markdown(
+            f"<div style='text-align:center; padding-top:8px'>Page {len(ss.lib_cursors)}</div>",
+            unsafe_allow_html=True,
+        )
+    with p3:
+        if st.button("Older →", disabled=not has_older, key="lib_older"):
+            ss.lib_cursors.append(page_cursor(entries))
+            st.rerun()
@@ -0,0 +1,20 @@
+# app/pipelines/background.py
+# Job handlers for work that should outlive a Streamlit rerun (see utils/jobs.py).
+from typing import Dict
+
+from utils.jobs import JobCancelled, JobContext, register
+from .book import BookOptions, produce_book
+
+@register("book")
+def book_job(params: Dict, ctx: JobContext) -> Dict:
+    """params: {"story": str, "options": BookOptions fields}; output goes to data/books/<job id>."""
+    options = {**params.get("options", {}), "out_dir": f"data/books/{ctx.job_id}"}
+    result = produce_book(
+        params["story"],
+        BookOptions(**options),
+        on_progress=lambda msg, done, total: ctx.progress(msg, done / max(1, total)),
+        should_cancel=lambda: ctx.cancelled,
+    )
+    if result["cancelled"]:
+        raise JobCancelled()
+    return result
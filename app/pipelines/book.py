@@ -0,0 +1,187 @@
+# app/pipelines/book.py
+import os, threading, uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from utils.stage_graph import StageGraph
+
+# Concurrent cloud illustration requests per book (the stage graph's thread pool).
+CLOUD_IMAGE_WORKERS = int(os.getenv("CLOUD_IMAGE_WORKERS", "4"))
+
+@dataclass
+class BookOptions:
+    title: str = "My Storybook"
+    num_scenes: int = 6
+    prefer_cloud_llm: bool = True
+    use_cloud_img: bool = True
+    img_model: Optional[str] = None       # None -> image_gen default for the device
+    steps: int = 6
+    narrate: bool = True                  # per-scene caption narration (NARRATION_FORMAT, Opus by default)
+    use_llm_cache: bool = True
+    use_image_cache: bool = True
+    image_workers: int = CLOUD_IMAGE_WORKERS
+    out_dir: Optional[str] = None         # images/, audio/ and the PDF go here; None -> data/books/<run id>
+
+# CPU-bound / non-thread-safe stages (PDF layout, pyttsx3) share one process pool.
+BOOK_PROCESS_WORKERS = int(os.getenv("BOOK_PROCESS_WORKERS", "2"))
+_proc_pool: Optional[ProcessPoolExecutor] = None
+_proc_lock = threading.Lock()
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _proc_pool
+    with _proc_lock:
+        if _proc_pool is None or getattr(_proc_pool, "_broken", False):
+            _proc_pool = ProcessPoolExecutor(max_workers=BOOK_PROCESS_WORKERS)
+        return _proc_pool
+
+# ---------- stage functions (top level so process workers can import them) ----------
+
+def _cloud_image(prompt: str, out_path: str, use_cache: bool) -> Optional[str]:
+    from pipelines.cloud_image import generate_image_cloud
+    return generate_image_cloud(prompt, out_path, use_cache=use_cache)
+
+def _local_images(jobs: List[tuple], model_id: Optional[str], steps: int, use_cache: bool) -> Dict[int, str]:
+    """Render the scenes the cloud missed in one batched diffusers call."""
+    if not jobs:
+        return {}
+    from pipelines.image_gen import generate_images
+    paths = generate_images([j[1] for j in jobs], [j[2] for j in jobs],
+                            model_id=model_id, steps=steps, use_cache=use_cache)
+    return {j[0]: p for j, p in zip(jobs, paths)}
+
+def _narrate(text: str, out_wav: str) -> str:
+    from pipelines.tts import tts_to_file
+    return tts_to_file(text, out_wav)
+
+def _assemble_pdf(title: str, scenes: List[Dict], out_pdf: str) -> str:
+    import shutil
+    from pipelines.pdf import cached_build_pdf_from_scenes
+    # An unchanged book (same captions and image bytes) reuses the cached layout
+    shutil.copyfile(cached_build_pdf_from_scenes(title, scenes), out_pdf)
+    return out_pdf
+
+# ---------- entry point ----------
+
+def produce_book(
+    story: str,
+    options: Optional[BookOptions] = None,
+    on_progress: Optional[Callable[[str, int, int], None]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+) -> Dict:
+    """
+    Plan -> per-scene illustration -> per-scene narration -> PDF, run as a
+    stage graph: illustrations and narrations start as soon as their scene
+    is planned, in parallel; the PDF is laid out once every image settled.
+
+    on_progress(message, done, total) is called from the calling thread.
+    should_cancel() is polled while stages run; once it returns true no new
+    stage starts, queued ones are dropped and the partial result is returned.
+    Returns {"title", "scenes", "pdf_path", "out_dir", "timings", "errors", "cancelled"}; each scene
+    carries "caption", "image_prompt", "image_path" and (if narrated) "audio_path".
+    """
+    from pipelines.scene_plan import plan_scenes_stream
+    from pipelines.tts import narration_ext
+    from utils.prompt_templates import image_prompt_from_scene
+
+    opts = options or BookOptions()
+    # Every run gets its own folder, so concurrent builds never overwrite each
+    # other and a finished book's files stay valid after later builds
+    out_dir = Path(opts.out_dir or Path("data/books") / f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}")
+    images_dir, audio_dir = out_dir / "images", out_dir / "audio"
+    for d in (images_dir, audio_dir):
+        d.mkdir(parents=True, exist_ok=True)
+
+    scenes: List[Dict] = []
+    audio_ext = narration_ext() if opts.narrate else "wav"
+    graph = StageGraph(processes=_process_pool(), thread_workers=max(2, opts.image_workers + 1),
+                       should_cancel=should_cancel)
+
+    def plan():
+        for i, sc in enumerate(plan_scenes_stream(story, num_scenes=opts.num_scenes,
+                                                  prefer_cloud=opts.prefer_cloud_llm,
+                                                  use_cache=opts.use_llm_cache), 1):
+            if graph.cancelled:         # stop streaming the plan; nothing more will be submitted
+                break
+            scenes.append(sc)
+            base = sc.get("image_prompt") or image_prompt_from_scene(sc["caption"])
+            sc["_prompt"] = f"No text on the image. {base}"
+            sc["_out"] = str(images_dir / f"scene_{i:02d}.png")
+            if opts.use_cloud_img:
+                graph.add(f"image:{i:02d}", _cloud_image, sc["_prompt"], sc["_out"], opts.use_image_cache)
+            if opts.narrate:
+                graph.add(f"narrate:{i:02d}", _narrate, sc["caption"],
+                          str(audio_dir / f"scene_{i:02d}.{audio_ext}"), kind="process")
+
+        image_tasks = [f"image:{i:02d}" for i in range(1, len(scenes) + 1)] if opts.use_cloud_img else []
+
+        def local_jobs(results):
+            jobs = [(i, sc["_prompt"], sc["_out"]) for i, sc in enumerate(scenes, 1)
+                    if not results.get(f"image:{i:02d}")]
+            return (jobs, opts.img_model, opts.steps, opts.use_image_cache)
+
+        graph.add("image:local", _local_images, deps=image_tasks, args_from=local_jobs)
+
+        def pdf_args(results):
+            for i, sc in enumerate(scenes, 1):
+                sc["image_path"] = results.get(f"image:{i:02d}") or results["image:local"].get(i)
+            pages = [{"caption": sc["caption"], "image_path": sc.get("image_path")} for sc in scenes]
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            return (opts.title, pages, str(out_dir / f"storybook_scenes_{ts}.pdf"))
+
+        graph.add("pdf", _assemble_pdf, deps=["image:local"], kind="process", args_from=pdf_args)
+        return len(scenes)
+
+    graph.add("plan", plan)
+
+    def on_event(kind: str, name: str):
+        if not on_progress or kind == "added":
+            return
+        done, total = graph.progress()
+        stage, _, idx = name.partition(":")
+        label = {"plan": "Planned scenes", "image": "Illustrated scene", "narrate": "Narrated scene",
+                 "pdf": "Assembled PDF"}.get(stage, stage)
+        if idx == "local":
+            label = "Rendered local illustrations"
+        elif idx:
+            label = f"{label} {int(idx)}"
+        if kind != "done":
+            label = f"{label} ({kind})"
+        on_progress(label, done, total)
+
+    graph.run(on_event)
+
+    for i, sc in enumerate(scenes, 1):
+        sc.pop("_prompt", None)
+        sc.pop("_out", None)
+        if opts.narrate and f"narrate:{i:02d}" in graph.results:
+            sc["audio_path"] = graph.results[f"narrate:{i:02d}"]
+    return {
+        "title": opts.title,
+        "scenes": scenes,
+        "pdf_path": graph.results.get("pdf"),
+        "out_dir": str(out_dir),
+        "timings": graph.stage_timings(),
+        "errors": {k: str(v) for k, v in graph.errors.items()},
+        "cancelled": graph.cancelled,
+    }
+
+if __name__ == "__main__":
+    # Script use, from the app/ folder:  python -m pipelines.book story.txt --title "Moon Seed"
+    import argparse, json
+    ap = argparse.ArgumentParser(description="Produce an illustrated picture book from a story text file.")
+    ap.add_argument("story_file")
+    ap.add_argument("--title", default="My Storybook")
+    ap.add_argument("--scenes", type=int, default=6)
+    ap.add_argument("--no-cloud", action="store_true", help="Local LLM planning and local images only")
+    ap.add_argument("--no-narration", action="store_true")
+    args = ap.parse_args()
+    result = produce_book(
+        Path(args.story_file).read_text(encoding="utf-8"),
+        BookOptions(title=args.title, num_scenes=args.scenes, prefer_cloud_llm=not args.no_cloud,
+                    use_cloud_img=not args.no_cloud, narrate=not args.no_narration),
+        on_progress=lambda msg, done, total: print(f"[book] {done}/{total} {msg}"),
+    )
+    print(json.dumps(result, indent=2, ensure_ascii=False))
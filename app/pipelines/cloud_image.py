@@ -1,9 +1,49 @@
-import os, requests
+import os, random, threading, time
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 from typing import Optional
 
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import image_cache
+
 V2_URL = "https://api.stability.ai/v2beta/stable-image/generate/core"
 
+POOL_SIZE = int(os.getenv("STABILITY_POOL_SIZE", "8"))          # keep-alive connections per host
+MAX_RETRIES = int(os.getenv("STABILITY_MAX_RETRIES", "4"))
+BACKOFF_BASE_S = float(os.getenv("STABILITY_BACKOFF_S", "1.0"))
+BACKOFF_MAX_S = 30.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _get_session() -> requests.Session:
+    """One keep-alive session shared by every thread and session."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                # pool_block: extra concurrent requests wait for a warm connection
+                s.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, pool_block=True))
+                _session = s
+    return _session
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    """Honour Retry-After (seconds or HTTP date), else full-jitter exponential backoff."""
+    if retry_after:
+        try:
+            return min(max(0.0, float(retry_after)), BACKOFF_MAX_S)
+        except ValueError:
+            try:
+                wait = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                return min(max(0.0, wait), BACKOFF_MAX_S)
+            except Exception:
+                pass
+    return random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+
 def generate_image_cloud(
     prompt: str,
     out_path: str,
@@ -11,7 +51,15 @@ def generate_image_cloud(
     width: int = 1024,            # unused by v2beta
     height: int = 1024,           # unused by v2beta
     aspect_ratio: str = "1:1",
+    use_cache: bool = True,       # False = regenerate (the fresh image still refreshes the cache)
 ) -> Optional[str]:
+    # steps/width/height are ignored by v2beta, so they are not part of the key
+    key = image_cache.cache_key(prompt, "stability-core", aspect_ratio=aspect_ratio)
+    if use_cache:
+        hit = image_cache.fetch(key, out_path)
+        if hit:
+            return hit
+
     api_key = os.getenv("STABILITY_API_KEY")
     if not api_key:
         print("[cloud_image] No STABILITY_API_KEY set.")
@@ -33,13 +81,35 @@ def generate_image_cloud(
         # "output_format": (None, "png"),
     }
 
-    try:
-        r = requests.post(V2_URL, headers=headers, files=files, timeout=180)
-        if r.status_code == 200:
-            out.write_bytes(r.content)     # raw PNG/JPEG bytes
-            return str(out)
-        print(f"[cloud_image] {r.status_code} {r.reason}: {r.text[:500]}")
-        return None
-    except Exception as e:
-        print(f"[cloud_image] Error: {e}")
-        return None
+    session = _get_session()
+    part = out.with_name(out.name + ".part")
+    for attempt in range(MAX_RETRIES + 1):
+        last = attempt == MAX_RETRIES
+        try:
+            with session.post(V2_URL, headers=headers, files=files, timeout=(10, 180), stream=True) as r:
+                if r.status_code == 200:
+                    # raw PNG/JPEG bytes streamed to disk; rename so readers never see a partial file
+                    with open(part, "wb") as f:
+                        for chunk in r.iter_content(chunk_size=64 * 1024):
+                            f.write(chunk)
+                    part.replace(out)
+                    image_cache.store(key, str(out))
+                    return str(out)
+                print(f"[cloud_image] {r.status_code} {r.reason}: {r.text[:500]}")
+                if r.status_code not in RETRY_STATUS or last:
+                    return None
+                delay = _retry_delay(attempt, r.headers.get("Retry-After"))
+        except requests.RequestException as e:
+            # connection/timeouts, and bodies cut off mid-stream (ChunkedEncodingError)
+            print(f"[cloud_image] Network error: {e}")
+            if last:
+                return None
+            delay = _retry_delay(attempt, None)
+        except Exception as e:
+            print(f"[cloud_image] Error: {e}")
+            return None
+        finally:
+            part.unlink(missing_ok=True)        # only left behind by a failed download
+        print(f"[cloud_image] Retrying in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES})")
+        time.sleep(delay)
+    return None
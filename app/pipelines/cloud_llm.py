@@ -1,10 +1,23 @@
 import os
-from typing import Optional
+from typing import Iterator, List, Optional
 from dotenv import load_dotenv
 
+from utils import llm_cache
+from utils.prompt_templates import DEFAULT_SYSTEM
+
 load_dotenv()
 
-def gemini_generate_story(prompt: str, model_name: str = "gemini-1.5-flash") -> Optional[str]:
+def gemini_generate_story(
+    prompt: str,
+    model_name: str = "gemini-1.5-flash",
+    use_cache: bool = True,
+) -> Optional[str]:
+    system = DEFAULT_SYSTEM
+    if use_cache:
+        cached = llm_cache.get(model_name, system, prompt)
+        if cached:
+            return cached
+
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         return None
@@ -12,8 +25,50 @@ def gemini_generate_story(prompt: str, model_name: str = "gemini-1.5-flash") ->
         import google.generativeai as genai
         genai.configure(api_key=api_key)
         model = genai.GenerativeModel(model_name)
-        system = "You write imaginative, age-appropriate children's stories."
         resp = model.generate_content([{"role": "user", "parts": [system + "\n\n" + prompt]}])
-        return (resp.text or "").strip()
+        text = (resp.text or "").strip()
     except Exception:
         return None
+    if text:
+        llm_cache.put(model_name, system, prompt, text)
+    return text
+
+def gemini_stream_story(
+    prompt: str,
+    model_name: str = "gemini-1.5-flash",
+    use_cache: bool = True,
+) -> Iterator[str]:
+    """
+    Yield the reply in chunks as Gemini produces them. Yields nothing if the
+    cloud is unavailable, so callers can fall back. A cached reply is yielded
+    whole; a completed stream is written to the cache.
+    """
+    system = DEFAULT_SYSTEM
+    if use_cache:
+        cached = llm_cache.get(model_name, system, prompt)
+        if cached:
+            yield cached
+            return
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return
+    parts: List[str] = []
+    try:
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(model_name)
+        resp = model.generate_content([{"role": "user", "parts": [system + "\n\n" + prompt]}], stream=True)
+        for chunk in resp:
+            text = chunk.text or ""
+            if not parts:
+                text = text.lstrip()
+            if text:
+                parts.append(text)
+                yield text
+    except Exception as e:
+        print(f"[cloud_llm] stream failed: {e}")
+        return
+    full = "".join(parts).strip()
+    if full:
+        llm_cache.put(model_name, system, prompt, full)
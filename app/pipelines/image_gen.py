@@ -1,22 +1,109 @@
+import os, threading
 from pathlib import Path
+from typing import List, Optional
 import torch
 from PIL import Image
+from utils import image_cache
+from utils.model_cache import ModelCache
+
+# Resident diffusers pipelines; DIFFUSERS_CACHE_MB caps their summed size.
+_pipes = ModelCache("diffusers", budget_mb=float(os.getenv("DIFFUSERS_CACHE_MB", "8192")))
+
+# Prompts per denoising pass (0 -> 4 on GPU, 2 on CPU). Halved automatically on OOM.
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", "0"))
+
+def _resolve_model_id(model_id: Optional[str]) -> str:
+    if model_id:
+        return model_id
+    # Lighter model on CPU; SDXL-Turbo on GPU
+    return "stabilityai/sdxl-turbo" if torch.cuda.is_available() else "stabilityai/sd-turbo"
+
+def get_pipeline(model_id: Optional[str] = None):
+    """Return a cached (pipeline, lock, device) for model_id, loading it on first use."""
+    from diffusers import AutoPipelineForText2Image
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model_id = _resolve_model_id(model_id)
+    dtype = torch.float16 if device == "cuda" else torch.float32
+
+    def _load():
+        pipe = AutoPipelineForText2Image.from_pretrained(model_id, torch_dtype=dtype).to(device)
+        pipe.set_progress_bar_config(disable=True)
+        return pipe, threading.Lock()
+
+    size_mb = (7000 if "xl" in model_id else 2600) * (1 if dtype == torch.float16 else 2)
+    pipe, lock = _pipes.get((model_id, device, str(dtype)), _load, size_mb=size_mb)
+    return pipe, lock, device
+
+def _placeholder(out_path: Path) -> str:
+    Image.new("RGB", (1024, 768), (240, 250, 255)).save(out_path)
+    return str(out_path)
+
+def _is_oom(e: Exception) -> bool:
+    return isinstance(e, torch.cuda.OutOfMemoryError) or "out of memory" in str(e).lower()
+
+def generate_images(
+    prompts: List[str],
+    out_paths: List[str],
+    model_id: str | None = None,
+    steps: int = 6,
+    batch_size: int | None = None,
+    use_cache: bool = True,
+) -> List[str]:
+    """
+    Render several prompts with one cached pipeline, batching prompts into a
+    single denoising pass. Cached illustrations are reused unless use_cache is
+    False. Failed images get a placeholder (never cached), like generate_image.
+    """
+    outs = [Path(p) for p in out_paths]
+    for p in outs:
+        p.parent.mkdir(parents=True, exist_ok=True)
+
+    model_id = _resolve_model_id(model_id)
+    keys = [image_cache.cache_key(p, "diffusers", model_id=model_id, steps=steps) for p in prompts]
+    results: List[Optional[str]] = [None] * len(outs)
+    todo: List[int] = []
+    for i, key in enumerate(keys):
+        hit = image_cache.fetch(key, str(outs[i])) if use_cache else None
+        if hit:
+            results[i] = hit
+        else:
+            todo.append(i)
+    if not todo:
+        return results
 
-def generate_image(prompt: str, out_path: str, model_id: str | None = None, steps: int = 6):
-    out_path = Path(out_path)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
     try:
-        from diffusers import AutoPipelineForText2Image
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        if model_id is None:
-            # Lighter model on CPU; SDXL-Turbo on GPU
-            model_id = "stabilityai/sdxl-turbo" if device == "cuda" else "stabilityai/sd-turbo"
-        pipe = AutoPipelineForText2Image.from_pretrained(
-            model_id, torch_dtype=torch.float16 if device == "cuda" else torch.float32
-        ).to(device)
-        image = pipe(prompt, num_inference_steps=steps, guidance_scale=0.0).images[0]
-        image.save(out_path)
-        return str(out_path)
-    except Exception:
-        Image.new("RGB", (1024, 768), (240, 250, 255)).save(out_path)
-        return str(out_path)
+        pipe, lock, device = get_pipeline(model_id)
+    except Exception as e:
+        print(f"[image_gen] Could not load pipeline: {e}")
+        for i in todo:
+            results[i] = _placeholder(outs[i])
+        return results
+
+    bs = batch_size or IMAGE_BATCH_SIZE or (4 if device == "cuda" else 2)
+    pos = 0
+    with lock:
+        while pos < len(todo):
+            chunk = todo[pos:pos + bs]
+            try:
+                images = pipe([prompts[i] for i in chunk], num_inference_steps=steps, guidance_scale=0.0).images
+            except Exception as e:
+                if _is_oom(e) and bs > 1:
+                    bs //= 2
+                    if device == "cuda":
+                        torch.cuda.empty_cache()
+                    print(f"[image_gen] Out of memory, retrying with batch size {bs}")
+                    continue
+                print(f"[image_gen] Error: {e}")
+                images = []
+            for j, i in enumerate(chunk):
+                if j < len(images):
+                    images[j].save(outs[i])
+                    image_cache.store(keys[i], str(outs[i]))
+                    results[i] = str(outs[i])
+                else:
+                    results[i] = _placeholder(outs[i])
+            pos += len(chunk)
+    return results
+
+def generate_image(prompt: str, out_path: str, model_id: str | None = None, steps: int = 6, use_cache: bool = True):
+    return generate_images([prompt], [out_path], model_id=model_id, steps=steps, use_cache=use_cache)[0]
@@ -0,0 +1,246 @@
+# app/pipelines/local_llm.py
+import os, queue, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from utils.model_cache import ModelCache
+from utils.prompt_templates import DEFAULT_SYSTEM
+
+LLAMA_N_CTX = int(os.getenv("LLAMA_N_CTX", "4096"))
+LLAMA_THREADS = int(os.getenv("LLAMA_THREADS", "0")) or None     # None -> llama.cpp default
+LLAMA_GPU_LAYERS = int(os.getenv("LLAMA_GPU_LAYERS", "0"))
+
+# System prompts whose KV state is precomputed when the model loads. Every story/scene
+# request uses DEFAULT_SYSTEM; the last one warmed stays resident, so it goes last.
+WARM_SYSTEMS = (DEFAULT_SYSTEM,)
+
+def _messages(system: str, prompt: str) -> List[Dict]:
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt},
+    ]
+
+_DONE = object()     # end-of-stream marker
+
+class LlamaEngine:
+    """
+    One resident llama.cpp model behind a single-worker request queue.
+
+    A Llama context can only serve one request at a time, so every call from
+    every session is queued onto the same worker thread. After loading, the
+    KV state of each warm system prompt is saved; a request restores the
+    state for its system prompt (when the context last held a different one)
+    and llama.cpp's prefix matching then evaluates only the user turn.
+    """
+
+    def __init__(self, model_path: str, warm_systems=WARM_SYSTEMS):
+        self.model_path = model_path
+        self.warm_systems = tuple(warm_systems)
+        self._queue = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llama")
+        self._llm = None
+        self._prefix_states: Dict[str, object] = {}
+        self._last_system: Optional[str] = None
+        # Start loading right away; the first request simply queues behind it.
+        self._loading = self._queue.submit(self._load)
+
+    # ----- worker-thread only -----
+    def _load(self):
+        from llama_cpp import Llama
+        t0 = time.perf_counter()
+        self._llm = Llama(
+            model_path=self.model_path,
+            n_ctx=LLAMA_N_CTX,
+            n_threads=LLAMA_THREADS,
+            n_gpu_layers=LLAMA_GPU_LAYERS,
+            verbose=False,
+        )
+        for system in self.warm_systems:
+            self._llm.create_chat_completion(messages=_messages(system, ""), max_tokens=1)
+            self._prefix_states[system] = self._llm.save_state()
+            self._last_system = system
+        print(f"[local_llm] loaded {Path(self.model_path).name} in {time.perf_counter() - t0:.1f}s")
+
+    def _use_prefix(self, system: str):
+        state = self._prefix_states.get(system)
+        if state is not None and system != self._last_system:
+            self._llm.load_state(state)
+        self._last_system = system
+
+    def _chat(self, prompt: str, system: str, max_tokens: int, temperature: float) -> str:
+        self._use_prefix(system)
+        out = self._llm.create_chat_completion(
+            messages=_messages(system, prompt), max_tokens=max_tokens, temperature=temperature
+        )
+        return out["choices"][0]["message"]["content"].strip()
+
+    def _stream(self, prompt: str, system: str, max_tokens: int, temperature: float,
+                out: "queue.Queue", cancelled: threading.Event):
+        try:
+            self._use_prefix(system)
+            for part in self._llm.create_chat_completion(
+                messages=_messages(system, prompt), max_tokens=max_tokens, temperature=temperature, stream=True
+            ):
+                if cancelled.is_set():
+                    break
+                text = part["choices"][0]["delta"].get("content")
+                if text:
+                    out.put(text)
+            out.put(_DONE)
+        except Exception as e:
+            out.put(e)
+
+    # ----- public, any thread -----
+    def chat(
+        self,
+        prompt: str,
+        system: str = DEFAULT_SYSTEM,
+        max_tokens: int = 700,
+        temperature: float = 0.9,
+        timeout: Optional[float] = None,
+    ) -> str:
+        self._loading.result()      # surfaces load errors to the caller
+        fut = self._queue.submit(self._chat, prompt, system, max_tokens, temperature)
+        return fut.result(timeout=timeout)
+
+    def stream(
+        self,
+        prompt: str,
+        system: str = DEFAULT_SYSTEM,
+        max_tokens: int = 700,
+        temperature: float = 0.9,
+    ) -> Iterator[str]:
+        """Yield reply chunks as the queued worker produces them."""
+        self._loading.result()
+        out: "queue.Queue" = queue.Queue()
+        cancelled = threading.Event()
+        self._queue.submit(self._stream, prompt, system, max_tokens, temperature, out, cancelled)
+        try:
+            while True:
+                item = out.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Consumer stopped early: let the worker free the model for the next request.
+            cancelled.set()
+
+    def close(self):
+        self._queue.shutdown(wait=True)
+        self._llm = None
+        self._prefix_states.clear()
+
+def _close_engine(engine: "LlamaEngine"):
+    threading.Thread(target=engine.close, daemon=True).start()
+
+# Keep at most LLAMA_CACHE_MB of GGUF weights resident (default: one 8B Q4 model).
+_engines = ModelCache("llama", budget_mb=float(os.getenv("LLAMA_CACHE_MB", "6144")), on_evict=_close_engine)
+
+def get_llama_engine(model_path: str) -> LlamaEngine:
+    """Return the resident engine for a GGUF file, starting it on first use."""
+    key = str(Path(model_path).resolve())
+    size_mb = Path(model_path).stat().st_size / (1024 * 1024)
+    engine = _engines.get(key, lambda: LlamaEngine(model_path), size_mb=size_mb)
+    if engine._loading.done() and engine._loading.exception() is not None:
+        # A previous load failed; drop it and try again.
+        _engines.discard(key)
+        engine = _engines.get(key, lambda: LlamaEngine(model_path), size_mb=size_mb)
+    return engine
+
+# ---------- transformers fallback (TinyLlama) ----------
+
+TINYLLAMA_ID = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+FALLBACK_INT8 = os.getenv("FALLBACK_INT8", "1") == "1"          # dynamic int8 Linear layers on CPU
+FALLBACK_THREADS = int(os.getenv("FALLBACK_THREADS", "0"))      # 0 -> torch default
+
+_fallbacks = ModelCache("transformers", budget_mb=float(os.getenv("FALLBACK_CACHE_MB", "4096")))
+_fallback_stats: Dict = {}
+
+def _load_fallback(model_id: str, device: str, int8: bool):
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    import torch
+    if device == "cpu" and FALLBACK_THREADS > 0:
+        torch.set_num_threads(FALLBACK_THREADS)
+    tok = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id, torch_dtype=torch.float16 if device == "cuda" else torch.float32
+    )
+    model.to(device).eval()
+    if int8:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return tok, model, threading.Lock()
+
+def get_fallback_model(model_id: str = TINYLLAMA_ID):
+    """Return a resident (tokenizer, model, lock, device) for the transformers fallback."""
+    import torch
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    int8 = FALLBACK_INT8 and device == "cpu"
+    size_mb = 1100 * (1 if int8 else 2 if device == "cuda" else 4)    # 1.1B params
+    tok, model, lock = _fallbacks.get(
+        (model_id, device, int8), lambda: _load_fallback(model_id, device, int8), size_mb=size_mb
+    )
+    return tok, model, lock, device
+
+def fallback_generate(prompt: str, system: str = DEFAULT_SYSTEM, max_new_tokens: int = 550) -> str:
+    import torch
+    tok, model, lock, device = get_fallback_model()
+    chat = f"<|system|>\n{system}\n<|user|>\n{prompt}\n<|assistant|>\n"
+    inputs = tok(chat, return_tensors="pt").to(device)
+    n_in = inputs["input_ids"].shape[-1]
+    # One generation at a time: parallel CPU generations just fight over cores.
+    with lock, torch.inference_mode():
+        t0 = time.perf_counter()
+        out = model.generate(**inputs, do_sample=True, temperature=0.9, top_p=0.9, max_new_tokens=max_new_tokens)
+        dt = time.perf_counter() - t0
+    n_new = int(out.shape[-1] - n_in)
+    _fallback_stats.update(tokens=n_new, seconds=round(dt, 2), tokens_per_sec=round(n_new / max(dt, 1e-6), 1))
+    print(f"[local_llm] fallback: {n_new} tokens in {dt:.1f}s ({_fallback_stats['tokens_per_sec']} tok/s)")
+    return tok.decode(out[0][n_in:], skip_special_tokens=True).strip()
+
+def fallback_stream(prompt: str, system: str = DEFAULT_SYSTEM, max_new_tokens: int = 550) -> Iterator[str]:
+    """Like fallback_generate, but yields decoded text as tokens are sampled."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    class _StopOnEvent(StoppingCriteria):
+        # Ends generate() early once the reader went away, releasing the model lock
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    tok, model, lock, device = get_fallback_model()
+    chat = f"<|system|>\n{system}\n<|user|>\n{prompt}\n<|assistant|>\n"
+    inputs = tok(chat, return_tensors="pt").to(device)
+    n_in = inputs["input_ids"].shape[-1]
+    streamer = TextIteratorStreamer(tok, skip_prompt=True, skip_special_tokens=True)
+    cancelled = threading.Event()
+
+    def _run():
+        with lock, torch.inference_mode():
+            t0 = time.perf_counter()
+            try:
+                out = model.generate(**inputs, streamer=streamer, do_sample=True, temperature=0.9, top_p=0.9,
+                                     max_new_tokens=max_new_tokens,
+                                     stopping_criteria=StoppingCriteriaList([_StopOnEvent()]))
+            except Exception as e:
+                print(f"[local_llm] fallback stream failed: {e}")
+                streamer.end()
+                return
+            dt = time.perf_counter() - t0
+        n_new = int(out.shape[-1] - n_in)
+        _fallback_stats.update(tokens=n_new, seconds=round(dt, 2), tokens_per_sec=round(n_new / max(dt, 1e-6), 1))
+        print(f"[local_llm] fallback: {n_new} tokens in {dt:.1f}s ({_fallback_stats['tokens_per_sec']} tok/s)")
+
+    threading.Thread(target=_run, daemon=True).start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+    finally:
+        # reader finished or abandoned the stream (rerun, page change)
+        cancelled.set()
+
+def last_fallback_stats() -> Dict:
+    """Tokens, seconds and tokens/sec of the most recent fallback generation."""
+    return dict(_fallback_stats)
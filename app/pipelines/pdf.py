@@ -1,11 +1,17 @@
 # app/pipelines/pdf.py
+import hashlib, json, os, threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
+from io import BytesIO
 from typing import List, Dict, Optional
-from uuid import uuid4
 
 from fpdf import FPDF
 from PIL import Image, UnidentifiedImageError
 
+# Print resolution for embedded illustrations; 150 DPI is plenty for home printers.
+PDF_IMAGE_DPI = 150
+
 # ---------- text helpers ----------
 
 REPLACEMENTS = {
@@ -51,14 +57,24 @@ def _setup_font(pdf: FPDF) -> str:
 
 # ---------- image handling ----------
 
-def _safe_image_fit(pdf: FPDF, img_path: str, y: float = 20, max_h: float = 170):
+def _safe_image_fit(
+    pdf: FPDF,
+    img_path: str,
+    y: float = 20,
+    max_h: float = 170,
+    dpi: int = PDF_IMAGE_DPI,
+    jpeg_quality: Optional[int] = None,
+):
     """
-    Open image safely, convert to RGB if needed, and draw scaled to fit width.
-    Uses a UNIQUE temp filename to avoid FPDF image caching (fixes 'same image' bug).
+    Open image safely and draw it scaled to fit width, entirely in memory.
+    Pixels beyond what the draw box needs at `dpi` are dropped before
+    embedding; with `jpeg_quality` the page image is JPEG-compressed
+    (fpdf embeds JPEG bytes as-is), otherwise fpdf stores it losslessly.
     """
     try:
         img = Image.open(img_path)
-    except (FileNotFoundError, UnidentifiedImageError) as e:
+        img.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError) as e:
         print(f"[pdf] Skipping image {img_path}: {e}")
         return
 
@@ -71,21 +87,35 @@ def _safe_image_fit(pdf: FPDF, img_path: str, y: float = 20, max_h: float = 170)
     draw_w, draw_h = w * scale, h * scale
     x = (pdf.w - draw_w) / 2
 
-    tmp = Path(f"data/tmp_pdf_image_{uuid4().hex}.png")
-    tmp.parent.mkdir(parents=True, exist_ok=True)
-    img.save(tmp)
-
-    try:
-        pdf.image(tmp.as_posix(), x=x, y=y, w=draw_w, h=draw_h)
-    finally:
-        try:
-            tmp.unlink(missing_ok=True)
-        except Exception:
-            pass
+    # draw size in inches (pdf.k = points per user unit) -> pixels needed at target DPI
+    target_w = max(1, round(draw_w * pdf.k / 72 * dpi))
+    target_h = max(1, round(draw_h * pdf.k / 72 * dpi))
+    if target_w < w:
+        img = img.resize((target_w, target_h), Image.LANCZOS)
+
+    src = img
+    if jpeg_quality:
+        if img.mode == "RGBA":
+            flat = Image.new("RGB", img.size, (255, 255, 255))
+            flat.paste(img, mask=img.getchannel("A"))
+            img = flat
+        src = BytesIO()
+        img.save(src, format="JPEG", quality=jpeg_quality, optimize=True)
+        src.seek(0)
+
+    # fpdf keys in-memory images by content hash, so distinct pages never collide
+    pdf.image(src, x=x, y=y, w=draw_w, h=draw_h)
 
 # ---------- main builders ----------
 
-def build_pdf(title: str, story: str, images: List[Optional[str]], out_path: str) -> str:
+def build_pdf(
+    title: str,
+    story: str,
+    images: List[Optional[str]],
+    out_path: str,
+    dpi: int = PDF_IMAGE_DPI,
+    jpeg_quality: Optional[int] = None,
+) -> str:
     out = Path(out_path)
     out.parent.mkdir(parents=True, exist_ok=True)
 
@@ -121,12 +151,18 @@ def build_pdf(title: str, story: str, images: List[Optional[str]], out_path: str
         if not p:
             continue
         pdf.add_page()
-        _safe_image_fit(pdf, p, y=20, max_h=230)
+        _safe_image_fit(pdf, p, y=20, max_h=230, dpi=dpi, jpeg_quality=jpeg_quality)
 
     pdf.output(out.as_posix())
     return out.as_posix()
 
-def build_pdf_from_scenes(title: str, scenes: List[Dict], out_path: str) -> str:
+def build_pdf_from_scenes(
+    title: str,
+    scenes: List[Dict],
+    out_path: str,
+    dpi: int = PDF_IMAGE_DPI,
+    jpeg_quality: Optional[int] = None,
+) -> str:
     out = Path(out_path)
     out.parent.mkdir(parents=True, exist_ok=True)
 
@@ -159,7 +195,7 @@ def build_pdf_from_scenes(title: str, scenes: List[Dict], out_path: str) -> str:
         pdf.add_page()
         ipath = sc.get("image_path")
         if ipath and Path(ipath).exists():
-            _safe_image_fit(pdf, ipath, y=20, max_h=170)
+            _safe_image_fit(pdf, ipath, y=20, max_h=170, dpi=dpi, jpeg_quality=jpeg_quality)
             pdf.set_y(20 + 175)
 
         pdf.set_font(font, "", 14)
@@ -167,3 +203,122 @@ def build_pdf_from_scenes(title: str, scenes: List[Dict], out_path: str) -> str:
 
     pdf.output(out.as_posix())
     return out.as_posix()
+
+# ---------- memoized builders ----------
+
+PDF_CACHE_DIR = Path("data/cache/pdfs")
+PDF_CACHE_MAX_FILES = int(os.getenv("PDF_CACHE_MAX_FILES", "64"))
+_LAYOUT_VERSION = 1     # bump when page layout changes so old cache entries are ignored
+
+_DIGEST_MEMO_MAX = 1024
+_digest_lock = threading.Lock()
+_file_digests: "OrderedDict[tuple, str]" = OrderedDict()     # (path, size, mtime_ns) -> sha256, LRU
+_rebuilders: "OrderedDict[str, tuple]" = OrderedDict()       # cached PDF path -> (key, build), LRU
+
+def _file_digest(path: Optional[str]) -> Optional[str]:
+    """Content hash of an image file, memoized on (path, size, mtime)."""
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (str(Path(path).resolve()), st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        hit = _file_digests.get(key)
+        if hit:
+            _file_digests.move_to_end(key)
+    if hit:
+        return hit
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _file_digests[key] = digest
+        while len(_file_digests) > _DIGEST_MEMO_MAX:
+            _file_digests.popitem(last=False)
+    return digest
+
+def _pdf_key(kind: str, payload: Dict) -> str:
+    payload = dict(payload, kind=kind, layout=_LAYOUT_VERSION,
+                   dejavu=(Path("data/fonts") / "DejaVuSans.ttf").exists())
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _cached(key: str, build) -> str:
+    PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PDF_CACHE_DIR / f"{key}.pdf"
+    with _digest_lock:
+        # remembered so pdf_bytes can rebuild a file trimmed from the cache
+        _rebuilders[path.as_posix()] = (key, build)
+        _rebuilders.move_to_end(path.as_posix())
+        while len(_rebuilders) > PDF_CACHE_MAX_FILES * 2:
+            _rebuilders.popitem(last=False)
+    try:
+        os.utime(path)
+        return path.as_posix()
+    except FileNotFoundError:           # never built, or just trimmed by another builder
+        pass
+    # pid too: forked process-pool workers can share thread idents
+    tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp.pdf")
+    build(tmp.as_posix())
+    tmp.replace(path)
+    # keep only the most recently used PDFs; other builders' temp files are
+    # skipped, and files renamed or deleted meanwhile are ignored
+    files = []
+    for p in PDF_CACHE_DIR.glob("*.pdf"):
+        if p.name.endswith(".tmp.pdf"):
+            continue
+        try:
+            files.append((p.stat().st_mtime, p))
+        except FileNotFoundError:
+            continue
+    files.sort(key=lambda f: f[0], reverse=True)
+    for _, old in files[PDF_CACHE_MAX_FILES:]:
+        old.unlink(missing_ok=True)
+    return path.as_posix()
+
+def cached_build_pdf(
+    title: str,
+    story: str,
+    images: List[Optional[str]],
+    dpi: int = PDF_IMAGE_DPI,
+    jpeg_quality: Optional[int] = None,
+) -> str:
+    """build_pdf, memoized on title, text, image contents and layout options. Returns the cached PDF path."""
+    key = _pdf_key("story", {
+        "title": title, "story": story, "images": [_file_digest(p) for p in images or [] if p],
+        "dpi": dpi, "jpeg_quality": jpeg_quality,
+    })
+    return _cached(key, lambda out: build_pdf(title, story, images, out, dpi=dpi, jpeg_quality=jpeg_quality))
+
+def cached_build_pdf_from_scenes(
+    title: str,
+    scenes: List[Dict],
+    dpi: int = PDF_IMAGE_DPI,
+    jpeg_quality: Optional[int] = None,
+) -> str:
+    """build_pdf_from_scenes, memoized the same way. Returns the cached PDF path."""
+    key = _pdf_key("scenes", {
+        "title": title,
+        "scenes": [[sc.get("caption", ""), _file_digest(sc.get("image_path"))] for sc in scenes or []],
+        "dpi": dpi, "jpeg_quality": jpeg_quality,
+    })
+    return _cached(key, lambda out: build_pdf_from_scenes(title, scenes, out, dpi=dpi, jpeg_quality=jpeg_quality))
+
+@lru_cache(maxsize=16)
+def pdf_bytes(path: str) -> bytes:
+    """
+    Bytes of a cached PDF for download buttons, kept in memory across reruns.
+    Cache paths are content-addressed, so a path's bytes never change; if the
+    file was trimmed from the cache meanwhile, it is rebuilt.
+    """
+    try:
+        return Path(path).read_bytes()
+    except FileNotFoundError:
+        with _digest_lock:
+            recipe = _rebuilders.get(path)
+        if recipe is None:
+            raise
+        return Path(_cached(*recipe)).read_bytes()
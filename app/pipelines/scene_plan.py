@@ -1,7 +1,7 @@
 # app/pipelines/scene_plan.py
 import json, re
-from typing import List, Dict, Optional
-from .cloud_llm import gemini_generate_story
+from typing import Iterator, List, Dict, Optional
+from .cloud_llm import gemini_stream_story
 
 JSON_HINT = """Return ONLY a JSON array like:
 [
@@ -43,35 +43,135 @@ def _fallback_naive(story: str, num_scenes: int) -> List[Dict]:
         })
     return scenes
 
-def plan_scenes(story_text: str, num_scenes: int = 6, prefer_cloud: bool = True) -> List[Dict]:
+class _JsonObjectStream:
     """
-    Returns a list of dicts: [{"caption": str, "image_prompt": str}, ...]
+    Incremental scanner for a JSON array that arrives in chunks. feed() returns
+    every top-level object of the array that closed in the new text, so each
+    scene can be used before the rest of the reply has been generated.
+    Only a "[" followed by "{" starts the array, so bracketed prose such as
+    "Here are [6] scenes:" is skipped.
+    """
+
+    def __init__(self):
+        self._in_array = False
+        self._opened = False      # saw "[", waiting for its first non-space character
+        self._found = 0
+        self._done = False
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._buf: List[str] = []
+
+    def feed(self, text: str) -> List[Dict]:
+        out = []
+        for ch in text:
+            if self._done:
+                break
+            if not self._in_array:
+                if self._opened and ch.isspace():
+                    continue
+                if not (self._opened and ch == "{"):
+                    self._opened = ch == "["
+                    continue
+                self._opened, self._in_array = False, True
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth, self._buf = 1, ["{"]
+                elif ch == "]":
+                    # an array without objects wasn't the scene list: keep looking
+                    self._done = self._found > 0
+                    self._in_array = False
+                continue
+            self._buf.append(ch)
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = json.loads("".join(self._buf))
+                        if isinstance(obj, dict):
+                            out.append(obj)
+                            self._found += 1
+                    except Exception:
+                        pass
+                    self._buf = []
+        return out
+
+def _clean_scene(item) -> Optional[Dict]:
+    # Ensure required keys exist
+    if not isinstance(item, dict):
+        return None
+    cap = (item.get("caption") or "").strip()
+    ip  = (item.get("image_prompt") or "").strip()
+    if not cap:
+        return None
+    if not ip:
+        ip = f"children's picture book, soft watercolor, bright and friendly. Depict: {cap}. No text on image."
+    return {"caption": cap, "image_prompt": ip}
+
+def _plan_prompt(story_text: str, num_scenes: int) -> str:
+    return (
+        "Split the following children's story into clear visual scenes.\n"
+        f"Create exactly {num_scenes} scenes.\n"
+        "Each scene needs:\n"
+        "- caption: 1–2 short, simple sentences a child can read\n"
+        "- image_prompt: a concise visual description (no text overlay), children's picture-book watercolor style\n\n"
+        f"{JSON_HINT}\n\n"
+        f"Story:\n---\n{story_text}\n---"
+    )
+
+def plan_scenes_stream(
+    story_text: str,
+    num_scenes: int = 6,
+    prefer_cloud: bool = True,
+    use_cache: bool = True,
+) -> Iterator[Dict]:
+    """
+    Yield {"caption", "image_prompt"} dicts one at a time, each as soon as its
+    JSON object closes in the streamed Gemini reply.
     """
+    emitted = 0
     if prefer_cloud:
-        prompt = (
-            "Split the following children's story into clear visual scenes.\n"
-            f"Create exactly {num_scenes} scenes.\n"
-            "Each scene needs:\n"
-            "- caption: 1–2 short, simple sentences a child can read\n"
-            "- image_prompt: a concise visual description (no text overlay), children's picture-book watercolor style\n\n"
-            f"{JSON_HINT}\n\n"
-            f"Story:\n---\n{story_text}\n---"
-        )
-        txt = gemini_generate_story(prompt)
-        if txt:
-            arr = _extract_json_array(txt)
-            if isinstance(arr, list) and arr:
-                # Ensure required keys exist
-                cleaned = []
-                for item in arr[:num_scenes]:
-                    cap = (item.get("caption") or "").strip()
-                    ip  = (item.get("image_prompt") or "").strip()
-                    if not cap:
-                        continue
-                    if not ip:
-                        ip = f"children's picture book, soft watercolor, bright and friendly. Depict: {cap}. No text on image."
-                    cleaned.append({"caption": cap, "image_prompt": ip})
-                if cleaned:
-                    return cleaned
-    # Fallback: simple paragraph split
-    return _fallback_naive(story_text, num_scenes)
+        parser = _JsonObjectStream()
+        parts: List[str] = []
+        # Keep reading after num_scenes so the full reply still reaches the cache.
+        for chunk in gemini_stream_story(_plan_prompt(story_text, num_scenes), use_cache=use_cache):
+            parts.append(chunk)
+            for item in parser.feed(chunk):
+                scene = _clean_scene(item)
+                if scene and emitted < num_scenes:
+                    emitted += 1
+                    yield scene
+        if not emitted and parts:
+            # Reply was not a clean streamed array; try the whole-text extractor.
+            arr = _extract_json_array("".join(parts))
+            if isinstance(arr, list):
+                for item in arr:
+                    scene = _clean_scene(item)
+                    if scene and emitted < num_scenes:
+                        emitted += 1
+                        yield scene
+    if not emitted:
+        # Fallback: simple paragraph split
+        yield from _fallback_naive(story_text, num_scenes)
+
+def plan_scenes(
+    story_text: str,
+    num_scenes: int = 6,
+    prefer_cloud: bool = True,
+    use_cache: bool = True,
+) -> List[Dict]:
+    """
+    Returns a list of dicts: [{"caption": str, "image_prompt": str}, ...]
+    """
+    return list(plan_scenes_stream(story_text, num_scenes, prefer_cloud=prefer_cloud, use_cache=use_cache))
@@ -1,9 +1,70 @@
-from transformers import pipeline
+import os, threading
+from pathlib import Path
+from typing import List
 
-_classifier = pipeline("sentiment-analysis", model="distilroberta-base")
+MODEL_ID = "distilroberta-base"
 
-def detect_sentiment(text: str) -> str:
-    if not text.strip():
-        return "NEUTRAL"
-    out = _classifier(text[:512])[0]["label"].upper()
+# "torch" (default) or "onnx": int8-quantized ONNX Runtime on CPU (needs optimum[onnxruntime]).
+BACKEND = os.getenv("SENTIMENT_BACKEND", "torch").lower()
+ONNX_DIR = Path("models/sentiment_onnx")
+BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "16"))
+
+_classifier = None
+_lock = threading.Lock()
+
+def _build_torch():
+    from transformers import pipeline
+    return pipeline("sentiment-analysis", model=MODEL_ID)
+
+def _build_onnx():
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer, pipeline
+
+    qdir = ONNX_DIR / MODEL_ID.replace("/", "__")
+    if not (qdir / "model_quantized.onnx").exists():
+        # One-off export + dynamic int8 quantization, reused on later starts.
+        fp32_dir = qdir / "fp32"
+        ORTModelForSequenceClassification.from_pretrained(MODEL_ID, export=True).save_pretrained(fp32_dir)
+        quantizer = ORTQuantizer.from_pretrained(fp32_dir)
+        qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=qdir, quantization_config=qconfig)
+        AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(qdir)
+
+    model = ORTModelForSequenceClassification.from_pretrained(qdir, file_name="model_quantized.onnx")
+    tok = AutoTokenizer.from_pretrained(qdir)
+    return pipeline("sentiment-analysis", model=model, tokenizer=tok)
+
+def _get_classifier():
+    """Build the classifier on first use (not at import) and keep it for the process."""
+    global _classifier
+    if _classifier is None:
+        with _lock:
+            if _classifier is None:
+                if BACKEND == "onnx":
+                    try:
+                        _classifier = _build_onnx()
+                    except Exception as e:
+                        print(f"[sentiment] ONNX backend unavailable, using torch: {e}")
+                if _classifier is None:
+                    _classifier = _build_torch()
+    return _classifier
+
+def _to_label(raw: str) -> str:
+    out = raw.upper()
     return out if out in {"POSITIVE", "NEGATIVE"} else "NEUTRAL"
+
+def detect_sentiment_batch(texts: List[str], batch_size: int = BATCH_SIZE) -> List[str]:
+    """Classify many texts in padded batches; blank texts are NEUTRAL."""
+    labels = ["NEUTRAL"] * len(texts)
+    idx = [i for i, t in enumerate(texts) if t and t.strip()]
+    if not idx:
+        return labels
+    clf = _get_classifier()
+    outs = clf([texts[i] for i in idx], batch_size=batch_size, truncation=True, max_length=512)
+    for i, o in zip(idx, outs):
+        labels[i] = _to_label(o["label"])
+    return labels
+
+def detect_sentiment(text: str) -> str:
+    return detect_sentiment_batch([text])[0]
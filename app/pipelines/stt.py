@@ -1,23 +1,198 @@
-import os
-from faster_whisper import WhisperModel
+import io, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio
+from utils.model_cache import ModelCache
+
+SAMPLE_RATE = 16000
+# Long-audio mode: inputs longer than STT_LONG_AUDIO_S are split at silences into
+# <= CHUNK_S pieces (one Whisper window) and decoded by STT_WORKERS in parallel.
+LONG_AUDIO_S = float(os.getenv("STT_LONG_AUDIO_S", "60"))
+CHUNK_S = 30.0
+STT_WORKERS = int(os.getenv("STT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Decode profiles (keyword arguments for WhisperModel.transcribe):
+#   fast     - greedy, no timestamp tokens; language pinned to STT_LANGUAGE if set
+#              (skips detection), else detected; for 1-2 sentence prompts
+#   accurate - beam search with language detection (the original behaviour)
+#   words    - accurate plus per-word timestamps
+STT_LANGUAGE = os.getenv("STT_LANGUAGE") or None     # e.g. "en"; unset = auto-detect
+DECODE_PROFILES: Dict[str, Dict] = {
+    "fast": dict(beam_size=1, best_of=1, temperature=0.0, condition_on_previous_text=False,
+                 without_timestamps=True, language=STT_LANGUAGE),
+    "accurate": dict(beam_size=5),
+    "words": dict(beam_size=5, word_timestamps=True),
+}
+
+_local = threading.local()      # per-thread, so concurrent sessions see their own stats
+
+# Approximate resident size (MB) of each checkpoint at float16.
+_MODEL_MB = {"tiny": 75, "base": 145, "small": 480, "medium": 1500, "large-v3": 3100}
+
+# Warm Whisper models shared by every session; WHISPER_CACHE_MB caps the total.
+_registry = ModelCache("whisper", budget_mb=float(os.getenv("WHISPER_CACHE_MB", "4096")))
+
+def _estimate_mb(model_size: str, compute_type: str) -> float:
+    base = _MODEL_MB.get(model_size, 1500)
+    if compute_type.startswith("int8"):
+        return base * 0.5
+    if compute_type == "float32":
+        return base * 2.0
+    return float(base)
+
+def get_whisper_model(
+    model_size: str = "small",
+    device: str = "cpu",
+    compute_type: str = "int8",
+    num_workers: int = STT_WORKERS,
+) -> WhisperModel:
+    """
+    Return a cached WhisperModel, loading it on first use. num_workers > 1
+    lets that many transcribe() calls run at once, splitting the CPU cores.
+    Callers keep the default so short and long audio share one resident model.
+    """
+    device = device.lower()
+
+    def _load() -> WhisperModel:
+        # Force CTranslate2 to stay on CPU even if a GPU is present/misconfigured.
+        if device == "cpu":
+            os.environ["CT2_FORCE_CPU"] = "1"
+        else:
+            os.environ.pop("CT2_FORCE_CPU", None)
+        threads = max(1, (os.cpu_count() or 1) // num_workers) if num_workers > 1 else 0
+        return WhisperModel(model_size, device=device, compute_type=compute_type,
+                            num_workers=num_workers, cpu_threads=threads)
+
+    key = (model_size, device, compute_type, num_workers)
+    return _registry.get(key, _load, size_mb=_estimate_mb(model_size, compute_type))
+
+def whisper_cache_stats() -> dict:
+    """Load/hit/miss counters and resident models of the Whisper registry."""
+    return _registry.stats()
+
+def load_audio(audio: Union[str, bytes, np.ndarray], sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Any supported input -> 16 kHz mono float32, in memory.
+    audio: a file path, encoded file bytes (WAV/MP3/M4A, decoded with PyAV),
+    or a sample buffer at `sample_rate` shaped (n,) or (n, channels).
+    """
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return decode_audio(io.BytesIO(bytes(audio)), sampling_rate=SAMPLE_RATE)
+    if not isinstance(audio, np.ndarray):
+        return decode_audio(str(audio), sampling_rate=SAMPLE_RATE)
+
+    if np.issubdtype(audio.dtype, np.integer):
+        samples = audio.astype(np.float32) / np.iinfo(audio.dtype).max
+    else:
+        samples = audio.astype(np.float32, copy=False)
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1, dtype=np.float32)
+    if sample_rate != SAMPLE_RATE and len(samples):
+        # linear resampling is plenty for speech recognition
+        n_out = int(round(len(samples) * SAMPLE_RATE / sample_rate))
+        t_out = np.arange(n_out, dtype=np.float64) * (sample_rate / SAMPLE_RATE)
+        samples = np.interp(t_out, np.arange(len(samples)), samples).astype(np.float32)
+    return np.ascontiguousarray(samples)
+
+def _speech_chunks(audio, max_s: float = CHUNK_S) -> List[Tuple[int, int]]:
+    """
+    (start, end) sample ranges covering the speech in `audio`, cut only at
+    VAD-detected silences and merged up to max_s seconds each.
+    """
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    spans = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=500, speech_pad_ms=200))
+    max_len = int(max_s * SAMPLE_RATE)
+    chunks: List[Tuple[int, int]] = []
+    for sp in spans:
+        start, end = sp["start"], sp["end"]
+        if chunks and end - chunks[-1][0] <= max_len:
+            chunks[-1] = (chunks[-1][0], end)
+            continue
+        # a single unbroken span longer than a window is cut hard
+        while end - start > max_len:
+            chunks.append((start, start + max_len))
+            start += max_len
+        chunks.append((start, end))
+    return chunks
+
+def _decode(model: WhisperModel, audio, vad: bool, opts: Dict, offset_s: float = 0.0) -> Tuple[str, List[Dict], str]:
+    """One transcribe() pass -> (text, words, language). Word times are shifted by offset_s."""
+    kwargs = dict(vad_filter=True, vad_parameters=dict(min_silence_duration_ms=500)) if vad else {}
+    segments, info = model.transcribe(audio, **opts, **kwargs)
+    texts, words = [], []
+    for s in segments:
+        texts.append(s.text.strip())
+        for w in s.words or []:
+            words.append({"word": w.word, "start": round(w.start + offset_s, 2), "end": round(w.end + offset_s, 2)})
+    return " ".join(texts).strip(), words, info.language
+
+def transcribe_long(
+    audio,
+    model_size: str = "small",
+    compute_type: str = "int8",
+    device: str = "cpu",
+    workers: int = STT_WORKERS,
+    opts: Optional[Dict] = None,
+) -> Tuple[str, List[Dict], str, int]:
+    """
+    Transcribe 16 kHz mono float32 audio chunk-parallel; text (and words)
+    are stitched in order. Returns (text, words, language, chunks).
+    """
+    opts = DECODE_PROFILES["accurate"] if opts is None else opts
+    chunks = _speech_chunks(audio)
+    if not chunks:
+        return "", [], opts.get("language") or "", 0
+    # The model is always loaded with STT_WORKERS so it stays one registry entry (the
+    # short path uses it too); `workers` and the chunk count only size the thread pool.
+    workers = max(1, min(workers, STT_WORKERS, len(chunks)))
+    model = get_whisper_model(model_size, device=device, compute_type=compute_type)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stt") as pool:
+        # map() keeps input order regardless of which chunk finishes first
+        parts = list(pool.map(lambda c: _decode(model, audio[c[0]:c[1]], False, opts, c[0] / SAMPLE_RATE), chunks))
+    text = " ".join(p[0] for p in parts if p[0]).strip()
+    return text, [w for p in parts for w in p[1]], parts[0][2], len(chunks)
 
 def transcribe_audio(
-    audio_path: str,
+    audio: Union[str, bytes, np.ndarray],
     model_size: str = "small",          # tiny, base, small, medium, large-v3
     compute_type: str = "int8",         # int8 on CPU is fast & accurate enough
     device: str = "cpu",                # <-- force CPU (no cuDNN needed)
-):
-    # Force CTranslate2 to stay on CPU even if a GPU is present/misconfigured.
-    if device.lower() == "cpu":
-        os.environ["CT2_FORCE_CPU"] = "1"
+    long_audio: Optional[bool] = None,  # None: decide from duration (> STT_LONG_AUDIO_S)
+    sample_rate: int = SAMPLE_RATE,     # only for NumPy input
+    profile: str = "accurate",          # key of DECODE_PROFILES
+    language: Optional[str] = None,     # pin a language (overrides the profile)
+) -> str:
+    """
+    audio: path, encoded bytes or NumPy samples (see load_audio); nothing is
+    written to disk. Timing, real-time factor and (for the "words" profile)
+    word timestamps of the call are in last_transcription_stats().
+    """
+    if profile not in DECODE_PROFILES:
+        raise ValueError(f"Unknown STT profile: {profile}")
+    opts = dict(DECODE_PROFILES[profile])
+    if language:
+        opts["language"] = language
+    t0 = time.perf_counter()
+    audio = load_audio(audio, sample_rate)
+    if long_audio is None:
+        long_audio = len(audio) > LONG_AUDIO_S * SAMPLE_RATE and STT_WORKERS > 1
+    if long_audio:
+        text, words, lang, chunks = transcribe_long(audio, model_size=model_size, compute_type=compute_type,
+                                                    device=device, opts=opts)
     else:
-        os.environ.pop("CT2_FORCE_CPU", None)
-
-    model = WhisperModel(model_size, device=device, compute_type=compute_type)
-    segments, _ = model.transcribe(
-        audio_path,
-        vad_filter=True,
-        vad_parameters=dict(min_silence_duration_ms=500),
-        beam_size=5,
-    )
-    return " ".join(s.text.strip() for s in segments).strip()
+        model = get_whisper_model(model_size, device=device, compute_type=compute_type)
+        text, words, lang = _decode(model, audio, True, opts)
+        chunks = 1
+    dt = time.perf_counter() - t0
+    audio_s = len(audio) / SAMPLE_RATE
+    _local.stats = dict(profile=profile, model=model_size, language=lang, audio_s=round(audio_s, 2),
+                        seconds=round(dt, 2), rtf=round(dt / max(audio_s, 1e-6), 3), chunks=chunks, words=words)
+    print(f"[stt] {profile}/{model_size}: {audio_s:.1f}s audio in {dt:.2f}s (RTF {_local.stats['rtf']})")
+    return text
+
+def last_transcription_stats() -> Dict:
+    """profile, language, audio_s, seconds, rtf (seconds per audio second), chunks and words of this thread's last call."""
+    return dict(getattr(_local, "stats", {}))
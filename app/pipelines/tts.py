@@ -1,11 +1,249 @@
+import hashlib, json, os, shutil, sys, threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import pyttsx3
+from typing import Iterator, List, Optional
 
-def tts_to_file(text: str, out_wav: str):
-    out = Path(out_wav)
+TTS_RATE = int(os.getenv("TTS_RATE", "175"))
+TTS_VOICE = os.getenv("TTS_VOICE") or None          # pyttsx3 voice id; None = system default
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", str(min(4, os.cpu_count() or 1))))
+SEGMENT_CACHE_DIR = Path("data/cache/tts")
+SEGMENT_CACHE_MB = float(os.getenv("TTS_CACHE_MB", "512"))
+PARAGRAPH_PAUSE_S = 0.4
+
+# Narration is stored compressed: ogg (Opus, default) or mp3; wav keeps PCM.
+NARRATION_FORMAT = os.getenv("NARRATION_FORMAT", "ogg").lower()
+NARRATION_DIR = Path("data/audio/narration")
+NARRATION_CACHE_MB = float(os.getenv("NARRATION_CACHE_MB", "1024"))
+_FORMATS = {    # extension -> (soundfile format, subtype, sample rates the codec accepts, mime type)
+    "ogg": ("OGG", "OPUS", (8000, 12000, 16000, 24000, 48000), "audio/ogg"),
+    "mp3": ("MP3", "MPEG_LAYER_III", (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000), "audio/mpeg"),
+    "wav": ("WAV", "PCM_16", None, "audio/wav"),
+}
+_narration_ext: Optional[str] = None
+
+# pyttsx3 is not thread-safe: engines are bound to the thread that created them
+# (SAPI5 is a COM object), so each thread gets its own, synthesis is serialised
+# by a lock, and paragraphs are rendered in parallel by separate processes.
+_local = threading.local()
+_engine_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None or getattr(_pool, "_broken", False):
+            _pool = ProcessPoolExecutor(max_workers=TTS_WORKERS)
+        return _pool
+
+def narration_ext() -> str:
+    """NARRATION_FORMAT if this libsndfile build can encode it, else "wav"."""
+    global _narration_ext
+    if _narration_ext is None:
+        import soundfile as sf
+        ext = NARRATION_FORMAT if NARRATION_FORMAT in _FORMATS else "ogg"
+        fmt, subtype, _, _ = _FORMATS[ext]
+        if subtype not in sf.available_subtypes(fmt):
+            print(f"[tts] libsndfile cannot encode {fmt}/{subtype}; narration stays WAV")
+            ext = "wav"
+        _narration_ext = ext
+    return _narration_ext
+
+def audio_mime(path: str) -> str:
+    """MIME type for st.audio(format=...) from the file extension."""
+    return _FORMATS.get(Path(path).suffix.lstrip(".").lower(), _FORMATS["wav"])[3]
+
+def story_narration_path(text: str, rate: int = TTS_RATE, voice: Optional[str] = TTS_VOICE) -> Path:
+    """
+    Per-story narration file, named by the text and voice settings it was
+    made from. Looking one up counts as a use for NARRATION_CACHE_MB trimming.
+    """
+    key = hashlib.sha256(json.dumps([text, rate, voice]).encode("utf-8")).hexdigest()[:20]
+    path = NARRATION_DIR / f"{key}.{narration_ext()}"
+    _touch(path)
+    return path
+
+def _paragraphs(text: str) -> List[str]:
+    return [p.strip() for p in (text or "").split("\n\n") if p.strip()]
+
+def _touch(*paths: Path):
+    """Mark files as just used (mtime doubles as the LRU clock)."""
+    for p in paths:
+        try:
+            os.utime(p)
+        except FileNotFoundError:
+            pass
+
+def _trim(folder: Path, pattern: str, quota_mb: float):
+    """Drop least recently used files until `folder` is back under 90% of quota."""
+    files = []
+    for p in folder.glob(pattern):
+        if ".part" in p.name:           # being written right now
+            continue
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, p))
+    total, quota = sum(f[1] for f in files), quota_mb * 1024 * 1024
+    if total <= quota:
+        return
+    evicted = 0
+    for _, size, p in sorted(files):
+        if total <= quota * 0.9:
+            break
+        p.unlink(missing_ok=True)
+        total -= size
+        evicted += 1
+    print(f"[tts] Trimmed {evicted} files from {folder}")
+
+def _segment_path(text: str, rate: int, voice: Optional[str]) -> Path:
+    key = hashlib.sha256(
+        json.dumps({"text": text, "rate": rate, "voice": voice, "engine": "pyttsx3"}, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return SEGMENT_CACHE_DIR / key[:2] / f"{key}.wav"
+
+def _write_audio(data, sr: int, out: Path):
+    """Write float32 (n, channels) samples encoded as out's extension implies (mono, resampled if the codec needs it)."""
+    import numpy as np
+    import soundfile as sf
+
+    fmt, subtype, rates, _ = _FORMATS[out.suffix.lstrip(".").lower()]
+    if rates:
+        data = data.mean(axis=1, keepdims=True, dtype=np.float32)      # speech: mono is plenty
+        if sr not in rates:
+            target = min((r for r in rates if r >= sr), default=max(rates))
+            t_out = np.arange(int(len(data) * target / sr)) * (sr / target)
+            data = np.interp(t_out, np.arange(len(data)), data[:, 0]).astype(np.float32)[:, None]
+            sr = target
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.part")
+    sf.write(str(tmp), data, sr, format=fmt, subtype=subtype)
+    os.replace(tmp, out)
+
+def _thread_engine():
+    engine = getattr(_local, "engine", None)
+    if engine is None:
+        import pyttsx3
+        if sys.platform == "win32":
+            try:
+                import comtypes
+                comtypes.CoInitialize()
+            except ImportError:         # older pyttsx3 drives SAPI5 through pywin32
+                import pythoncom
+                pythoncom.CoInitialize()
+        engine = pyttsx3.Engine()       # not pyttsx3.init(): that hands every thread one shared engine
+        _local.engine = engine
+        _local.default_voice = engine.getProperty("voice")
+    return engine
+
+def _ready(wav: Path, ext: str) -> bool:
+    return wav.exists() and (ext == "wav" or wav.with_suffix(f".{ext}").exists())
+
+def _render_segment(text: str, out_wav: str, rate: int, voice: Optional[str], ext: str = "wav") -> str:
+    """
+    Synthesize one segment and encode it as `ext` (top level so process
+    workers can run it; encoding happens in the worker too). Returns the
+    playable file.
+    """
+    wav = Path(out_wav)
+    if not wav.exists():
+        with _engine_lock:
+            engine = _thread_engine()
+            engine.setProperty("rate", rate)
+            # None means the system default, not whatever voice the previous call set
+            engine.setProperty("voice", voice or _local.default_voice)
+            tmp = f"{out_wav}.{os.getpid()}.{threading.get_ident()}.part.wav"
+            engine.save_to_file(text, tmp)
+            engine.runAndWait()
+        os.replace(tmp, out_wav)
+    if ext == "wav":
+        return out_wav
+    encoded = wav.with_suffix(f".{ext}")
+    if not encoded.exists():
+        import soundfile as sf
+        data, sr = sf.read(out_wav, dtype="float32", always_2d=True)   # WAV, or AIFF on macOS
+        _write_audio(data, sr, encoded)
+    return str(encoded)
+
+def _concat(paths: List[Path], out: Path, pause_s: float = PARAGRAPH_PAUSE_S):
+    """Join segment WAVs into one track with a short pause between them, encoded as out's extension."""
+    import numpy as np
+    import soundfile as sf
+
+    parts, sr = [], None
+    for p in paths:
+        data, rate = sf.read(str(p), dtype="float32", always_2d=True)
+        if sr is None:
+            sr = rate
+        elif rate != sr:
+            raise ValueError(f"Segment {p} is {rate} Hz, expected {sr} Hz")
+        if parts:
+            parts.append(np.zeros((int(pause_s * sr), data.shape[1]), dtype=np.float32))
+        parts.append(data)
+    _write_audio(np.concatenate(parts), sr, out)
+
+def narrate_stream(
+    segments: List[str],
+    out_path: str,
+    rate: int = TTS_RATE,
+    voice: Optional[str] = TTS_VOICE,
+) -> Iterator[str]:
+    """
+    Narrate segments (paragraphs, scene captions) into one track at out_path,
+    encoded per its extension (.ogg Opus, .mp3 or .wav). Yields each
+    segment's playable file in order as soon as it is ready, so playback can
+    start before the whole track exists; the track is written last.
+
+    Segments are cached by text and voice settings, so only new or edited
+    ones are synthesized; those render and encode in parallel processes.
+    """
+    out = Path(out_path)
+    ext = out.suffix.lstrip(".").lower()
+    if ext not in _FORMATS:
+        raise ValueError(f"Unsupported narration format: {out.suffix}")
     out.parent.mkdir(parents=True, exist_ok=True)
-    engine = pyttsx3.init()
-    engine.setProperty("rate", 175)
-    engine.save_to_file(text, str(out))
-    engine.runAndWait()
-    return str(out)
+    segments = [s.strip() for s in segments if s and s.strip()]
+    if not segments:
+        raise ValueError("Nothing to narrate.")
+
+    wavs = [_segment_path(s, rate, voice) for s in segments]
+    missing = {str(w): s for w, s in zip(wavs, segments) if not _ready(w, ext)}    # repeated text renders once
+    for w in missing:
+        Path(w).parent.mkdir(parents=True, exist_ok=True)
+    futures = {}
+    if len(missing) > 1 and TTS_WORKERS > 1:
+        pool = _process_pool()
+        futures = {w: pool.submit(_render_segment, s, w, rate, voice, ext) for w, s in missing.items()}
+    print(f"[tts] {len(segments)} segments: {len(missing)} to synthesize, {len(segments) - len(missing)} cached")
+    _touch(*[p for w in wavs if str(w) not in missing for p in (w, w.with_suffix(f".{ext}"))])
+
+    for w, s in zip(wavs, segments):
+        w = str(w)
+        if w in futures:
+            yield futures[w].result()
+        else:
+            yield _render_segment(s, w, rate, voice, ext)     # cached: just returns the path
+
+    if len(wavs) == 1:
+        shutil.copyfile(wavs[0] if ext == "wav" else wavs[0].with_suffix(f".{ext}"), out)
+    else:
+        _concat(wavs, out)
+    if missing:
+        _trim(SEGMENT_CACHE_DIR, "*/*", SEGMENT_CACHE_MB)
+    if out.parent.resolve() == NARRATION_DIR.resolve():
+        _trim(NARRATION_DIR, "*", NARRATION_CACHE_MB)
+
+def tts_segments_to_file(
+    segments: List[str],
+    out_wav: str,
+    rate: int = TTS_RATE,
+    voice: Optional[str] = TTS_VOICE,
+) -> str:
+    """narrate_stream, waiting for the whole track. Returns its path."""
+    for _ in narrate_stream(segments, out_wav, rate=rate, voice=voice):
+        pass
+    return str(out_wav)
+
+def tts_to_file(text: str, out_wav: str, rate: int = TTS_RATE, voice: Optional[str] = TTS_VOICE) -> str:
+    """Narrate text paragraph by paragraph (see tts_segments_to_file)."""
+    return tts_segments_to_file(_paragraphs(text), out_wav, rate=rate, voice=voice)
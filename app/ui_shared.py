@@ -1,9 +1,11 @@
 # app/ui_shared.py
+import uuid
 from typing import List
 from pathlib import Path
 import streamlit as st
 
 READ_MODE_IMG_WIDTH = 520  # smaller preview on Read page
+LIBRARY_CARD_WIDTH = 256   # cover width in the 3-column Library grid
 
 def inject_css(font_px: int = 22, line_h: float = 1.6):
     st.set_page_config(page_title="Children's Storybook", page_icon="📚", layout="wide")
@@ -52,6 +54,8 @@ def init_state():
     ss.setdefault("title", "My Storybook")
     ss.setdefault("scenes", [])      # list of {"caption","image_path"}
     ss.setdefault("page_idx", 0)     # for preview nav
+    ss.setdefault("jobs", [])        # ids of background jobs started by this session
+    ss.setdefault("session_id", uuid.uuid4().hex)   # owner of this session's jobs in the shared job table
     Path("data/pdfs").mkdir(parents=True, exist_ok=True)
     Path("data/images").mkdir(parents=True, exist_ok=True)
     Path("data/audio").mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,69 @@
+# app/utils/blob_store.py
+from __future__ import annotations
+import hashlib, os, shutil, threading
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+# Content-addressed store for library assets: one file per unique content,
+# named by its SHA-256. Lives under the library folder so entries can hard-link to it.
+BLOB_DIR = Path("data/library/blobs")
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def blob_path(digest: str, suffix: str = "") -> Path:
+    return BLOB_DIR / digest[:2] / f"{digest}{suffix}"
+
+def put(src: Path) -> Tuple[str, Path]:
+    """Store a file's content once. Returns (digest, blob path); already-stored content is not copied again."""
+    src = Path(src)
+    digest = file_digest(src)
+    dest = blob_path(digest, src.suffix.lower())
+    if not dest.exists():
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f"{dest.name}.{os.getpid()}.{threading.get_ident()}.part")
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)       # atomic: concurrent saves of the same content are harmless
+    return digest, dest
+
+def link(blob: Path, dest: Path):
+    """Materialise a blob at dest: a hard link when the filesystem allows it, else a copy."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.exists():
+        dest.unlink()
+    try:
+        os.link(blob, dest)
+    except OSError:
+        shutil.copyfile(blob, dest)
+
+def _digest_of(path: Path) -> str:
+    return path.name.split(".", 1)[0]
+
+def gc(live: Iterable[str], dry_run: bool = False) -> Dict[str, int]:
+    """
+    Delete blobs (and their renditions) whose digest is not in `live`.
+    Entry folders that hard-link a deleted blob keep their own copy of the bytes.
+    """
+    live = set(live)
+    removed = freed = 0
+    if not BLOB_DIR.exists():
+        return {"removed": 0, "freed_bytes": 0}
+    for p in BLOB_DIR.glob("*/*"):
+        if p.name.endswith(".part") or _digest_of(p) in live:
+            continue
+        freed += p.stat().st_size
+        removed += 1
+        if not dry_run:
+            p.unlink(missing_ok=True)
+    return {"removed": removed, "freed_bytes": freed}
+
+def stats() -> Dict[str, int]:
+    files = [p for p in BLOB_DIR.glob("*/*") if not p.name.endswith(".part")] if BLOB_DIR.exists() else []
+    return {
+        "blobs": len({_digest_of(p) for p in files}),
+        "bytes": sum(p.stat().st_size for p in files),
+    }
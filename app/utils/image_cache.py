@@ -0,0 +1,96 @@
+# app/utils/image_cache.py
+from __future__ import annotations
+import hashlib, json, os, shutil, threading
+from pathlib import Path
+from typing import Dict, Optional
+
+CACHE_DIR = Path("data/cache/images")
+QUOTA_MB = float(os.getenv("IMAGE_CACHE_MB", "1024"))
+
+_lock = threading.Lock()
+_total_bytes: Optional[int] = None      # computed lazily from disk, then tracked
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+def cache_key(
+    prompt: str,
+    backend: str,
+    model_id: Optional[str] = None,
+    steps: Optional[int] = None,
+    aspect_ratio: Optional[str] = None,
+) -> str:
+    blob = json.dumps(
+        {"prompt": prompt, "backend": backend, "model_id": model_id, "steps": steps, "aspect_ratio": aspect_ratio},
+        sort_keys=True,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _path(key: str) -> Path:
+    return CACHE_DIR / key[:2] / f"{key}.img"
+
+def fetch(key: str, out_path: str) -> Optional[str]:
+    """Copy a cached image to out_path and return it, or None on a miss."""
+    src = _path(key)
+    try:
+        out = Path(out_path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(src, out)
+        os.utime(src)       # mtime doubles as the LRU clock
+    except FileNotFoundError:
+        with _lock:
+            _stats["misses"] += 1
+        return None
+    with _lock:
+        _stats["hits"] += 1
+    return str(out)
+
+def store(key: str, image_path: str):
+    """Add a freshly generated image to the cache, evicting old entries over quota."""
+    global _total_bytes
+    dest = _path(key)
+    try:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f"{dest.name}.{threading.get_ident()}.tmp")
+        shutil.copyfile(image_path, tmp)
+        with _lock:
+            # a refresh (use_cache=False) replaces the entry: only the size difference is new
+            try:
+                old_size = dest.stat().st_size
+            except FileNotFoundError:
+                old_size = 0
+            tmp.replace(dest)
+    except Exception as e:
+        print(f"[image_cache] Could not store {image_path}: {e}")
+        return
+    with _lock:
+        _stats["stores"] += 1
+        if _total_bytes is None:
+            _total_bytes = sum(p.stat().st_size for p in CACHE_DIR.glob("*/*.img"))
+        else:
+            _total_bytes += dest.stat().st_size - old_size
+        if _total_bytes > QUOTA_MB * 1024 * 1024:
+            _evict()
+
+def _evict():
+    """Drop least recently used files until the cache is 90% of quota (lock held)."""
+    global _total_bytes
+    files = sorted(CACHE_DIR.glob("*/*.img"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in files)
+    target = QUOTA_MB * 1024 * 1024 * 0.9
+    for p in files:
+        if total <= target:
+            break
+        size = p.stat().st_size
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        _stats["evictions"] += 1
+    _total_bytes = total
+
+def stats() -> Dict:
+    with _lock:
+        out = dict(_stats)
+        out["bytes"] = _total_bytes
+        out["quota_mb"] = QUOTA_MB
+        return out
@@ -0,0 +1,187 @@
+# app/utils/jobs.py
+from __future__ import annotations
+import json, os, sqlite3, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+DB_PATH = Path("data/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+FINISHED = ("done", "failed", "cancelled")
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    """Handed to a running job: report progress and notice cancellation."""
+
+    def __init__(self, job_id: str, cancel_event: threading.Event):
+        self.job_id = job_id
+        self._cancel = cancel_event
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def progress(self, message: str, fraction: Optional[float] = None):
+        """Record progress; raises JobCancelled if cancel() was requested."""
+        if fraction is None:
+            _exec("UPDATE jobs SET message = ? WHERE id = ?", (message, self.job_id))
+        else:
+            _exec("UPDATE jobs SET message = ?, progress = ? WHERE id = ?",
+                  (message, max(0.0, min(1.0, fraction)), self.job_id))
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+_handlers: Dict[str, Callable[[Dict, JobContext], Any]] = {}
+_cancel_events: Dict[str, threading.Event] = {}
+_state_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+_ready = False
+
+def register(kind: str):
+    """Decorator: register `fn(params, ctx) -> JSON-serialisable result` for a job kind."""
+    def deco(fn):
+        _handlers[kind] = fn
+        return fn
+    return deco
+
+# ---------- storage ----------
+
+def _connect() -> sqlite3.Connection:
+    global _ready
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(DB_PATH, timeout=10)
+    con.row_factory = sqlite3.Row
+    if not _ready:
+        with _state_lock:
+            if not _ready:
+                con.execute("PRAGMA journal_mode=WAL")
+                con.execute(
+                    """CREATE TABLE IF NOT EXISTS jobs (
+                           id TEXT PRIMARY KEY,
+                           kind TEXT NOT NULL,
+                           status TEXT NOT NULL,
+                           params TEXT NOT NULL,
+                           owner TEXT,
+                           progress REAL NOT NULL DEFAULT 0,
+                           message TEXT NOT NULL DEFAULT '',
+                           result TEXT,
+                           error TEXT,
+                           created_at REAL NOT NULL,
+                           started_at REAL,
+                           finished_at REAL
+                       )"""
+                )
+                if "owner" not in {r["name"] for r in con.execute("PRAGMA table_info(jobs)")}:
+                    con.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")     # databases from before owners
+                con.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs(created_at)")
+                con.execute("CREATE INDEX IF NOT EXISTS jobs_owner ON jobs(owner, created_at)")
+                # Workers live in this process: anything unfinished from a previous run is gone.
+                con.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'interrupted (app restarted)', finished_at = ? "
+                    "WHERE status IN ('queued', 'running')", (time.time(),)
+                )
+                con.commit()
+                _ready = True
+    return con
+
+def _exec(sql: str, args: tuple = ()):
+    con = _connect()
+    try:
+        con.execute(sql, args)
+        con.commit()
+    finally:
+        con.close()
+
+def _row_to_job(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+# ---------- worker ----------
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _state_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+        return _pool
+
+def _run(job_id: str, kind: str, params: Dict):
+    cancel_event = _cancel_events[job_id]
+    try:
+        if cancel_event.is_set():
+            return
+        _exec("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), job_id))
+        result = _handlers[kind](params, JobContext(job_id, cancel_event))
+        _exec("UPDATE jobs SET status = 'done', progress = 1, result = ?, finished_at = ? WHERE id = ?",
+              (json.dumps(result, ensure_ascii=False), time.time(), job_id))
+    except JobCancelled:
+        _exec("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (time.time(), job_id))
+    except Exception as e:
+        print(f"[jobs] {kind} {job_id} failed: {e}")
+        _exec("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+              (str(e), time.time(), job_id))
+    finally:
+        with _state_lock:
+            _cancel_events.pop(job_id, None)
+
+# ---------- public API ----------
+
+def submit(kind: str, params: Dict, owner: Optional[str] = None) -> str:
+    """
+    Queue a job of a registered kind; returns its id immediately. `owner`
+    (e.g. a UI session id) lets list_jobs show each user only their own jobs.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job_id = uuid.uuid4().hex[:12]
+    _exec("INSERT INTO jobs (id, kind, status, params, owner, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+          (job_id, kind, json.dumps(params, ensure_ascii=False), owner, time.time()))
+    with _state_lock:
+        _cancel_events[job_id] = threading.Event()
+    _get_pool().submit(_run, job_id, kind, params)
+    return job_id
+
+def poll(job_id: str) -> Optional[Dict]:
+    """Current record of a job (status, progress, message, result, error), or None."""
+    con = _connect()
+    try:
+        row = con.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+    finally:
+        con.close()
+
+def cancel(job_id: str) -> bool:
+    """Ask a job to stop. Queued jobs never start; running ones stop at their next progress report."""
+    with _state_lock:
+        ev = _cancel_events.get(job_id)
+    if ev is None:
+        return False
+    ev.set()
+    _exec("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+          (time.time(), job_id))
+    return True
+
+def list_jobs(kind: Optional[str] = None, status: Optional[str] = None, owner: Optional[str] = None,
+              limit: int = 20) -> List[Dict]:
+    """Most recent jobs first; pass owner to list only the jobs submitted with it."""
+    sql, args = "SELECT * FROM jobs WHERE 1 = 1", []
+    if owner:
+        sql += " AND owner = ?"
+        args.append(owner)
+    if kind:
+        sql += " AND kind = ?"
+        args.append(kind)
+    if status:
+        sql += " AND status = ?"
+        args.append(status)
+    sql += " ORDER BY created_at DESC LIMIT ?"
+    args.append(limit)
+    con = _connect()
+    try:
+        return [_row_to_job(r) for r in con.execute(sql, args).fetchall()]
+    finally:
+        con.close()
@@ -1,14 +1,223 @@
 # app/utils/library.py
 from __future__ import annotations
-import json, shutil, time
+import json, re, sqlite3, threading, time
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+from utils import blob_store
+from utils.thumbs import make_renditions, rendition_path
 
 LIB_DIR = Path("data/library")
+CATALOG_PATH = LIB_DIR / "catalog.sqlite3"
+
+_catalog_lock = threading.Lock()
+_pdf_locks: Dict[str, threading.Lock] = {}
+_catalog_ready = False
+_has_fts = True         # False if this SQLite build lacks FTS5; search then falls back to LIKE
 
 def _ensure():
     LIB_DIR.mkdir(parents=True, exist_ok=True)
 
+# ---------- catalogue (SQLite index over entry folders) ----------
+
+def _catalog() -> sqlite3.Connection:
+    """
+    Connection to the library catalogue. meta.json stays the source of truth;
+    the catalogue mirrors it so listing never has to open entry folders.
+    Created (and back-filled from disk) on first use.
+    """
+    global _catalog_ready, _has_fts
+    _ensure()
+    con = sqlite3.connect(CATALOG_PATH, timeout=10)
+    con.row_factory = sqlite3.Row
+    if not _catalog_ready:
+        with _catalog_lock:
+            if not _catalog_ready:
+                con.execute("PRAGMA journal_mode=WAL")
+                con.execute(
+                    """CREATE TABLE IF NOT EXISTS entries (
+                           id TEXT PRIMARY KEY,
+                           title TEXT NOT NULL,
+                           created_at TEXT NOT NULL,
+                           folder TEXT NOT NULL,
+                           meta TEXT NOT NULL
+                       )"""
+                )
+                con.execute("CREATE INDEX IF NOT EXISTS entries_created ON entries(created_at DESC, id DESC)")
+                # One row per (entry, blob) it references; a blob's refcount is its row count
+                con.execute(
+                    """CREATE TABLE IF NOT EXISTS blob_refs (
+                           entry_id TEXT NOT NULL,
+                           digest TEXT NOT NULL,
+                           PRIMARY KEY (entry_id, digest)
+                       )"""
+                )
+                con.execute("CREATE INDEX IF NOT EXISTS blob_refs_digest ON blob_refs(digest)")
+                try:
+                    # Inverted index over title, story text and scene captions
+                    con.execute(
+                        """CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                               id UNINDEXED, title, story, captions,
+                               tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+                           )"""
+                    )
+                except sqlite3.OperationalError as e:
+                    print(f"[library] FTS5 unavailable, search will be slow: {e}")
+                    _has_fts = False
+                con.commit()
+                empty = con.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0
+                if _has_fts and not empty:
+                    # Catalogues from before search existed: index them once
+                    empty = con.execute("SELECT COUNT(*) FROM entries_fts").fetchone()[0] == 0
+                _catalog_ready = True
+                if empty and next(LIB_DIR.glob("*/meta.json"), None) is not None:
+                    _rebuild(con)
+    return con
+
+def _index_entry(con: sqlite3.Connection, meta: Dict, folder: Path, story: Optional[str] = None):
+    title = meta.get("title") or "My Storybook"
+    con.execute(
+        "INSERT OR REPLACE INTO entries (id, title, created_at, folder, meta) VALUES (?, ?, ?, ?, ?)",
+        (meta["id"], title, meta.get("created_at") or "", str(folder), json.dumps(meta, ensure_ascii=False)),
+    )
+    con.execute("DELETE FROM blob_refs WHERE entry_id = ?", (meta["id"],))
+    con.executemany("INSERT OR IGNORE INTO blob_refs (entry_id, digest) VALUES (?, ?)",
+                    [(meta["id"], d) for d in set(meta.get("blobs", {}).values())])
+    if _has_fts:
+        if story is None:
+            story_path = folder / "story.txt"
+            story = story_path.read_text(encoding="utf-8") if story_path.exists() else ""
+        captions = "\n".join(sc.get("caption", "") for sc in meta.get("scenes", []))
+        con.execute("DELETE FROM entries_fts WHERE id = ?", (meta["id"],))
+        con.execute("INSERT INTO entries_fts (id, title, story, captions) VALUES (?, ?, ?, ?)",
+                    (meta["id"], title, story, captions))
+
+def _rebuild(con: sqlite3.Connection) -> int:
+    con.execute("DELETE FROM entries")
+    con.execute("DELETE FROM blob_refs")
+    if _has_fts:
+        con.execute("DELETE FROM entries_fts")
+    n = 0
+    for child in LIB_DIR.iterdir():
+        meta_path = child / "meta.json"
+        if not meta_path.exists():
+            continue
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            meta.setdefault("id", child.name)
+            _index_entry(con, meta, child)
+            n += 1
+        except Exception as e:
+            print(f"[library] Skipping {child}: {e}")
+    con.commit()
+    return n
+
+def rebuild_catalog() -> int:
+    """Re-index every entry folder from its meta.json (repair). Returns the entry count."""
+    con = _catalog()
+    try:
+        return _rebuild(con)
+    finally:
+        con.close()
+
+def _catalog_put(meta: Dict, folder: Path, story: Optional[str] = None):
+    con = _catalog()
+    try:
+        _index_entry(con, meta, folder, story)
+        con.commit()
+    finally:
+        con.close()
+
+# ---------- assets (content-addressed, hard-linked into entry folders) ----------
+
+def _store_asset(src: Path, folder: Path, rel: str, blobs: Dict[str, str]) -> Path:
+    """Put src in the blob store, link it at folder/rel and record rel -> digest. Returns the blob path."""
+    digest, blob = blob_store.put(src)
+    blob_store.link(blob, folder / rel)
+    blobs[rel] = digest
+    return blob
+
+def _link_renditions(blob: Path, dest: Path, force: bool = False):
+    """Renditions are made once per blob, then linked next to each entry's copy."""
+    for name, path in make_renditions(blob, force=force).items():
+        blob_store.link(Path(path), rendition_path(dest, name))
+
+def _entry_metas():
+    for child in sorted(LIB_DIR.iterdir()) if LIB_DIR.exists() else []:
+        meta_path = child / "meta.json"
+        if meta_path.exists():
+            yield child, json.loads(meta_path.read_text(encoding="utf-8"))
+
+def _image_rels(meta: Dict) -> List[str]:
+    rels = [meta.get("cover_image")] + [sc.get("image_path") for sc in meta.get("scenes", [])]
+    return [r for r in rels if r]
+
+def backfill_renditions(force: bool = False) -> int:
+    """Make missing thumbnail/preview renditions for every saved cover and scene. Returns images processed."""
+    n = 0
+    for child, meta in _entry_metas():
+        blobs = meta.get("blobs", {})
+        for rel in _image_rels(meta):
+            blob = blob_store.blob_path(blobs[rel], Path(rel).suffix.lower()) if rel in blobs else None
+            if blob is not None and blob.exists():
+                _link_renditions(blob, child / rel, force=force)
+            elif (child / rel).exists():
+                make_renditions(child / rel, force=force)
+            else:
+                continue
+            n += 1
+    return n
+
+def dedupe_entries() -> int:
+    """Move assets of entries saved before the blob store into it (re-linking them). Returns entries migrated."""
+    n = 0
+    for child, meta in _entry_metas():
+        if "blobs" in meta:
+            continue
+        blobs: Dict[str, str] = {}
+        for rel in _image_rels(meta) + [meta.get("last_scene_pdf")]:
+            if rel and (child / rel).exists():
+                blob = _store_asset(child / rel, child, rel, blobs)
+                if rel != meta.get("last_scene_pdf"):
+                    _link_renditions(blob, child / rel)
+        meta["blobs"] = blobs
+        (child / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+        _catalog_put(meta, child)
+        n += 1
+    return n
+
+def gc_blobs(dry_run: bool = False) -> Dict[str, int]:
+    """
+    Forget catalogue rows whose entry folder was deleted, then delete blobs
+    no remaining entry references (refcount 0).
+    """
+    con = _catalog()
+    try:
+        gone = {r["id"] for r in con.execute("SELECT id, folder FROM entries") if not Path(r["folder"]).exists()}
+        if gone and not dry_run:
+            for eid in gone:
+                con.execute("DELETE FROM entries WHERE id = ?", (eid,))
+                con.execute("DELETE FROM blob_refs WHERE entry_id = ?", (eid,))
+                if _has_fts:
+                    con.execute("DELETE FROM entries_fts WHERE id = ?", (eid,))
+            con.commit()
+        live = {r["digest"] for r in con.execute("SELECT entry_id, digest FROM blob_refs")
+                if r["entry_id"] not in gone}
+    finally:
+        con.close()
+    out = blob_store.gc(live, dry_run=dry_run)
+    out["entries_forgotten"] = len(gone)
+    return out
+
+def storage_stats() -> Dict[str, int]:
+    """Unique blobs and bytes on disk, plus total references to them."""
+    con = _catalog()
+    try:
+        refs = con.execute("SELECT COUNT(*) FROM blob_refs").fetchone()[0]
+    finally:
+        con.close()
+    return {**blob_store.stats(), "refs": refs}
+
 def _now_id() -> str:
     return time.strftime("%Y%m%d_%H%M%S")
 
@@ -29,12 +238,12 @@ def save_snapshot(ss) -> str:
     (folder / "story.txt").write_text(ss.story, encoding="utf-8")
     (folder / "title.txt").write_text(ss.title or "My Storybook", encoding="utf-8")
 
-    # cover image
+    # cover image (assets are stored once by content and hard-linked here)
+    blobs: Dict[str, str] = {}
     cover_rel = None
     if ss.get("image_path") and Path(ss.image_path).exists():
-        cover_dest = folder / "cover.png"
-        shutil.copy(ss.image_path, cover_dest)
         cover_rel = "cover.png"
+        _link_renditions(_store_asset(Path(ss.image_path), folder, cover_rel, blobs), folder / cover_rel)
 
     # scenes (captions + images)
     scenes_meta: List[Dict] = []
@@ -45,25 +254,19 @@ def save_snapshot(ss) -> str:
             img_rel = None
             ipath = sc.get("image_path")
             if ipath and Path(ipath).exists():
-                dest = scenes_dir / f"scene_{i:02d}.png"
-                shutil.copy(ipath, dest)
                 img_rel = f"scenes/scene_{i:02d}.png"
+                _link_renditions(_store_asset(Path(ipath), folder, img_rel, blobs), folder / img_rel)
             scenes_meta.append({"caption": sc.get("caption", ""), "image_path": img_rel})
 
-    # PDFs: always build a FRESH story-only PDF for this entry
-    from pipelines.pdf import build_pdf
-
-    story_pdf_name = "story.pdf"
-    cover_abs = (folder / "cover.png") if cover_rel else None
-    images_for_story = [cover_abs.as_posix()] if cover_abs and cover_abs.exists() else []
-    build_pdf(ss.title, ss.story, images_for_story, str(folder / story_pdf_name))
-    last_story_pdf = story_pdf_name
+    # Story PDF: only a recipe; built on first download (see story_pdf_path)
+    story_pdf_recipe = {"title": ss.title or "My Storybook", "text": "story.txt",
+                        "images": [cover_rel] if cover_rel else []}
 
     # If a scene-book exists in session, copy it too (optional)
     last_scene_pdf = ss.get("last_scene_pdf")
     if last_scene_pdf and Path(last_scene_pdf).exists():
         pdf_name = Path(last_scene_pdf).name
-        shutil.copy(last_scene_pdf, folder / pdf_name)
+        _store_asset(Path(last_scene_pdf), folder, pdf_name, blobs)
         last_scene_pdf = pdf_name
     else:
         last_scene_pdf = None
@@ -74,24 +277,142 @@ def save_snapshot(ss) -> str:
         "title": ss.title or "My Storybook",
         "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
         "cover_image": cover_rel,
-        "last_story_pdf": last_story_pdf,
+        "last_story_pdf": None,
+        "story_pdf_recipe": story_pdf_recipe,
         "last_scene_pdf": last_scene_pdf,
         "scenes": scenes_meta,
+        "blobs": blobs,
     }
     (folder / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    _catalog_put(meta, folder, ss.story)
     return eid
 
-def list_entries(limit: int = 24) -> List[Dict]:
-    """Return most recent entries (desc)."""
-    _ensure()
+def list_entries(limit: int = 24, before: Optional[Tuple[str, str]] = None) -> List[Dict]:
+    """
+    Return most recent entries (desc), one page at a time.
+    `before` is the (created_at, id) of the last entry of the previous page;
+    keyset pagination keeps every page an index range scan.
+    """
+    con = _catalog()
+    try:
+        if before:
+            rows = con.execute(
+                "SELECT meta, folder FROM entries WHERE (created_at, id) < (?, ?) "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (before[0], before[1], limit),
+            ).fetchall()
+        else:
+            rows = con.execute(
+                "SELECT meta, folder FROM entries ORDER BY created_at DESC, id DESC LIMIT ?", (limit,)
+            ).fetchall()
+    finally:
+        con.close()
     entries: List[Dict] = []
-    for child in sorted(LIB_DIR.iterdir(), reverse=True):
-        meta = child / "meta.json"
-        if meta.exists():
-            data = json.loads(meta.read_text(encoding="utf-8"))
-            data["_folder"] = str(child)
-            entries.append(data)
-    return entries[:limit]
+    for row in rows:
+        data = json.loads(row["meta"])
+        data["_folder"] = row["folder"]
+        entries.append(data)
+    return entries
+
+def page_cursor(entries: List[Dict]) -> Optional[Tuple[str, str]]:
+    """Cursor for the page after `entries` (pass as list_entries(before=...))."""
+    if not entries:
+        return None
+    return entries[-1].get("created_at") or "", entries[-1]["id"]
+
+def _fts_query(text: str) -> str:
+    """
+    User text -> FTS5 query: "quoted words" stay phrases, every other word
+    becomes a prefix term, and all terms must match.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]+)"|(\w+)', text):
+        if phrase.strip():
+            terms.append('"' + phrase.strip().replace('"', '""') + '"')
+        elif word:
+            terms.append(f'"{word}"*')
+    return " ".join(terms)
+
+def search_entries(query: str, limit: int = 30) -> List[Dict]:
+    """
+    Ranked full-text search over title, story and scene captions (title
+    matches weigh most). Each hit carries a "_snippet" of the matching text.
+    """
+    q = _fts_query(query)
+    if not q:
+        return []
+    con = _catalog()
+    try:
+        if _has_fts:
+            rows = con.execute(
+                """SELECT e.meta, e.folder,
+                          snippet(entries_fts, -1, '**', '**', '…', 12) AS snip
+                   FROM entries_fts JOIN entries e ON e.id = entries_fts.id
+                   WHERE entries_fts MATCH ?
+                   ORDER BY bm25(entries_fts, 0.0, 10.0, 1.0, 3.0)
+                   LIMIT ?""",
+                (q, limit),
+            ).fetchall()
+        else:
+            like = f"%{query.strip()}%"
+            rows = con.execute(
+                "SELECT meta, folder, '' AS snip FROM entries WHERE title LIKE ? OR meta LIKE ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (like, like, limit),
+            ).fetchall()
+    except sqlite3.OperationalError as e:
+        print(f"[library] Bad search query {query!r}: {e}")
+        return []
+    finally:
+        con.close()
+    hits: List[Dict] = []
+    for row in rows:
+        data = json.loads(row["meta"])
+        data["_folder"] = row["folder"]
+        data["_snippet"] = row["snip"]
+        hits.append(data)
+    return hits
+
+def story_pdf_path(eid: str) -> Optional[str]:
+    """
+    The entry's story PDF, building it from its recipe on first request and
+    keeping it in the entry (as a blob) for later ones. None if it has
+    neither, or if there is no such entry.
+    """
+    folder = LIB_DIR / eid
+    meta_path = folder / "meta.json"
+    if not meta_path.exists():
+        print(f"[library] No library entry {eid!r}")
+        return None
+    with _catalog_lock:
+        lock = _pdf_locks.setdefault(eid, threading.Lock())
+    with lock:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        done = meta.get("last_story_pdf")
+        if done and (folder / done).exists():
+            return str(folder / done)
+        recipe = meta.get("story_pdf_recipe")
+        if not recipe:
+            return None
+        from pipelines.pdf import cached_build_pdf
+        try:
+            text = (folder / recipe["text"]).read_text(encoding="utf-8")
+            images = [str(folder / rel) for rel in recipe.get("images", []) if (folder / rel).exists()]
+            built = cached_build_pdf(recipe["title"], text, images)
+        except Exception as e:
+            print(f"[library] Story PDF for {eid} failed: {e}")
+            return None
+        blobs = meta.setdefault("blobs", {})
+        _store_asset(Path(built), folder, "story.pdf", blobs)
+        meta["last_story_pdf"] = "story.pdf"
+        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+        _catalog_put(meta, folder)
+        return str(folder / "story.pdf")
+
+def prebuild_pdfs(ids: Optional[List[str]] = None) -> int:
+    """Materialise story PDFs ahead of time for the given entries (default: all). Returns PDFs ready."""
+    targets = ids or [child.name for child, _ in _entry_metas()]
+    return sum(1 for eid in targets if story_pdf_path(eid))
 
 def load_entry_to_session(eid: str, ss) -> Dict:
     """Load a saved entry into session_state for reading."""
@@ -126,3 +447,30 @@ def load_entry_to_session(eid: str, ss) -> Dict:
     ss.scenes = scenes_abs
     ss.page_idx = 0
     return meta
+
+if __name__ == "__main__":
+    # Maintenance, from the app/ folder:  python -m utils.library rebuild
+    import argparse
+    ap = argparse.ArgumentParser(description="Library maintenance")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild", help="Re-index the catalogue from the entry folders on disk")
+    p_thumbs = sub.add_parser("thumbs", help="Make WebP thumbnail/preview renditions for existing entries")
+    p_thumbs.add_argument("--force", action="store_true", help="Re-render renditions that already exist")
+    sub.add_parser("dedupe", help="Move assets of older entries into the content-addressed blob store")
+    p_pre = sub.add_parser("prebuild", help="Build story PDFs now instead of on first download")
+    p_pre.add_argument("ids", nargs="*", help="Entry ids (default: every entry)")
+    p_gc = sub.add_parser("gc", help="Delete blobs no entry references any more")
+    p_gc.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+    args = ap.parse_args()
+    if args.cmd == "rebuild":
+        print(f"[library] Indexed {rebuild_catalog()} entries.")
+    elif args.cmd == "dedupe":
+        print(f"[library] Moved {dedupe_entries()} entries into the blob store.")
+        print(f"[library] Storage: {storage_stats()}")
+    elif args.cmd == "prebuild":
+        print(f"[library] {prebuild_pdfs(args.ids)} story PDFs ready.")
+    elif args.cmd == "gc":
+        print(f"[library] GC{' (dry run)' if args.dry_run else ''}: {gc_blobs(args.dry_run)}")
+        print(f"[library] Storage: {storage_stats()}")
+    elif args.cmd == "thumbs":
+        print(f"[library] Renditions ready for {backfill_renditions(args.force)} images.")
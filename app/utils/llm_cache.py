@@ -0,0 +1,84 @@
+# app/utils/llm_cache.py
+from __future__ import annotations
+import hashlib, os, sqlite3, threading, time
+from pathlib import Path
+from typing import Optional
+
+DB_PATH = Path("data/cache/llm_cache.sqlite3")
+TTL_S = float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600     # one week
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+
+_init_lock = threading.Lock()
+_ready = False
+
+def _connect() -> sqlite3.Connection:
+    """Short-lived connection per call; SQLite handles cross-thread/process locking."""
+    global _ready
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(DB_PATH, timeout=10)
+    if not _ready:
+        with _init_lock:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                       key TEXT PRIMARY KEY,
+                       model TEXT NOT NULL,
+                       response TEXT NOT NULL,
+                       created_at REAL NOT NULL,
+                       last_used REAL NOT NULL
+                   )"""
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            con.commit()
+            _ready = True
+    return con
+
+def cache_key(model: str, system: str, prompt: str) -> str:
+    h = hashlib.sha256()
+    for part in (model, system, prompt):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+def get(model: str, system: str, prompt: str) -> Optional[str]:
+    key = cache_key(model, system, prompt)
+    now = time.time()
+    try:
+        con = _connect()
+        try:
+            row = con.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at > ?", (key, now - TTL_S)
+            ).fetchone()
+            if row:
+                con.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                con.commit()
+            return row[0] if row else None
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        print(f"[llm_cache] read failed: {e}")
+        return None
+
+def put(model: str, system: str, prompt: str, response: str):
+    key = cache_key(model, system, prompt)
+    now = time.time()
+    try:
+        con = _connect()
+        try:
+            con.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            # expire by age, then trim least recently used rows over the cap
+            con.execute("DELETE FROM responses WHERE created_at <= ?", (now - TTL_S,))
+            con.execute(
+                """DELETE FROM responses WHERE key IN (
+                       SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                   )""",
+                (MAX_ENTRIES,),
+            )
+            con.commit()
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        print(f"[llm_cache] write failed: {e}")
@@ -0,0 +1,97 @@
+# app/utils/model_cache.py
+from __future__ import annotations
+import threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class ModelCache:
+    """
+    Process-wide, thread-safe LRU registry for heavyweight model objects.
+    Entries live at module level, so they survive Streamlit reruns and are
+    shared by every session. Idle entries are evicted (least recently used
+    first) once the summed size estimate goes over `budget_mb`.
+    """
+
+    def __init__(self, name: str, budget_mb: float, on_evict: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self.budget_mb = budget_mb
+        self.on_evict = on_evict
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()   # key -> (obj, size_mb)
+        self._lock = threading.RLock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0, "load_seconds": 0.0}
+
+    def get(self, key: Hashable, loader: Callable[[], Any], size_mb: float = 0.0) -> Any:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._items[key][0]
+            self._stats["misses"] += 1
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # One loader per key; other callers for the same key wait for it.
+        with key_lock:
+            with self._lock:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    return self._items[key][0]
+            t0 = time.perf_counter()
+            obj = loader()
+            dt = time.perf_counter() - t0
+            with self._lock:
+                self._items[key] = (obj, float(size_mb))
+                self._stats["loads"] += 1
+                self._stats["load_seconds"] += dt
+                self._evict(keep=key)
+            print(f"[model_cache] {self.name}: loaded {key} in {dt:.1f}s")
+            return obj
+
+    def _evict(self, keep: Hashable):
+        while self._used_mb() > self.budget_mb:
+            victim = next((k for k in self._items if k != keep), None)
+            if victim is None:
+                break
+            obj, _ = self._items.pop(victim)
+            self._key_locks.pop(victim, None)
+            self._stats["evictions"] += 1
+            print(f"[model_cache] {self.name}: evicted {victim}")
+            if self.on_evict:
+                try:
+                    self.on_evict(obj)
+                except Exception as e:
+                    print(f"[model_cache] {self.name}: on_evict failed: {e}")
+
+    def _used_mb(self) -> float:
+        return sum(size for _, size in self._items.values())
+
+    def discard(self, key: Hashable):
+        """Drop one entry (e.g. after it failed) without counting an eviction."""
+        with self._lock:
+            item = self._items.pop(key, None)
+            self._key_locks.pop(key, None)
+        if item and self.on_evict:
+            try:
+                self.on_evict(item[0])
+            except Exception:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._items):
+                obj, _ = self._items.pop(key)
+                if self.on_evict:
+                    try:
+                        self.on_evict(obj)
+                    except Exception:
+                        pass
+            self._key_locks.clear()
+
+    def stats(self) -> Dict:
+        """Counters plus what is currently resident."""
+        with self._lock:
+            out = dict(self._stats)
+            out["resident"] = [list(k) if isinstance(k, tuple) else k for k in self._items]
+            out["used_mb"] = round(self._used_mb(), 1)
+            out["budget_mb"] = self.budget_mb
+            return out
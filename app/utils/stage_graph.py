@@ -0,0 +1,155 @@
+# app/utils/stage_graph.py
+from __future__ import annotations
+import queue, threading, time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+CANCEL_POLL_S = 0.5     # how often run() checks should_cancel while tasks are busy
+
+class _Task:
+    __slots__ = ("name", "fn", "args", "args_from", "deps", "kind", "state")
+
+    def __init__(self, name, fn, args, args_from, deps, kind):
+        self.name, self.fn, self.args, self.args_from = name, fn, args, args_from
+        self.deps, self.kind, self.state = tuple(deps), kind, "waiting"
+
+class StageGraph:
+    """
+    Tiny dependency-graph executor for pipeline stages.
+
+    Each task names the tasks it depends on and whether it runs on the thread
+    pool ("thread", for I/O and GIL-releasing model calls) or the process pool
+    ("process", for CPU-bound or non-thread-safe work). A task is submitted
+    once all of its dependencies finished; `args_from(results)` can build its
+    arguments from their results. Running tasks may add new tasks (e.g. a
+    planner adding one task per scene). If a task raises, its error is kept
+    in `errors` and every task depending on it is skipped.
+
+    cancel() (or a true `should_cancel()`, polled while waiting) stops
+    submitting tasks and drops queued ones; tasks already running finish on
+    their own, and run() returns without waiting for them.
+    """
+
+    def __init__(self, threads: Optional[Executor] = None, processes: Optional[Executor] = None,
+                 thread_workers: int = 4, should_cancel: Optional[Callable[[], bool]] = None):
+        self._own_threads = threads is None
+        self._pools = {"thread": threads or ThreadPoolExecutor(thread_workers, thread_name_prefix="stage"),
+                       "process": processes}
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, _Task] = {}
+        self._events: "queue.Queue[Tuple[str, str, Any]]" = queue.Queue()
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}     # name -> (start, end), perf_counter
+        self._started: Dict[str, float] = {}
+        self._futures: Dict[str, Future] = {}
+        self._cancel = threading.Event()
+        self._should_cancel = should_cancel
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """True once cancel() was called or should_cancel() returned true. Long-running tasks may check it."""
+        if not self._cancel.is_set() and self._should_cancel and self._should_cancel():
+            self._cancel.set()
+        return self._cancel.is_set()
+
+    def add(self, name: str, fn: Callable, *args, deps: Iterable[str] = (), kind: str = "thread",
+            args_from: Optional[Callable[[Dict[str, Any]], tuple]] = None):
+        """Register a task. Safe to call from inside a running task."""
+        if kind == "process" and self._pools["process"] is None:
+            kind = "thread"
+        with self._lock:
+            if name in self._tasks:
+                raise ValueError(f"Duplicate stage task: {name}")
+            self._tasks[name] = _Task(name, fn, args, args_from, deps, kind)
+        self._events.put(("added", name, None))
+
+    def _submit_ready(self):
+        if self.cancelled:
+            return
+        with self._lock:
+            for t in self._tasks.values():
+                if t.state != "waiting":
+                    continue
+                if any(d in self.errors for d in t.deps):
+                    t.state = "failed"
+                    self.errors[t.name] = RuntimeError("dependency failed")
+                    self._events.put(("skipped", t.name, None))
+                    continue
+                if all(self._tasks.get(d) is not None and self._tasks[d].state == "done" for d in t.deps):
+                    t.state = "running"
+                    args = t.args_from(dict(self.results)) if t.args_from else t.args
+                    self._started[t.name] = time.perf_counter()
+                    fut = self._pools[t.kind].submit(t.fn, *args)
+                    self._futures[t.name] = fut
+                    fut.add_done_callback(lambda f, n=t.name: self._events.put(("finished", n, f)))
+
+    def run(self, on_event: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+        """
+        Drive the graph from the calling thread until every task settled.
+        on_event(kind, task_name) is called here (never from a worker) for
+        "added", "done", "failed" and "skipped" events. Returns early,
+        with whatever finished so far, if the graph is cancelled.
+        """
+        try:
+            self._submit_ready()
+            while not self.cancelled:
+                with self._lock:
+                    if all(t.state in ("done", "failed") for t in self._tasks.values()):
+                        break
+                try:
+                    kind, name, fut = self._events.get(timeout=CANCEL_POLL_S)
+                except queue.Empty:
+                    continue
+                if kind == "finished":
+                    end = time.perf_counter()
+                    with self._lock:
+                        task = self._tasks[name]
+                        try:
+                            self.results[name] = fut.result()
+                            task.state = "done"
+                            kind = "done"
+                        except BaseException as e:
+                            self.errors[name] = e
+                            task.state = "failed"
+                            kind = "failed"
+                            print(f"[stage_graph] {name} failed: {e}")
+                        self.timings[name] = (self._started.get(name, end), end)
+                if on_event:
+                    on_event(kind, name)
+                self._submit_ready()
+        finally:
+            # Queued work is dropped on cancel (or an exception from on_event);
+            # the process pool is shared, so only this graph's futures are cancelled there.
+            with self._lock:
+                for f in self._futures.values():
+                    f.cancel()
+            if self._own_threads:
+                self._pools["thread"].shutdown(wait=False, cancel_futures=True)
+        return self.results
+
+    def progress(self) -> Tuple[int, int]:
+        """(settled tasks, known tasks)."""
+        with self._lock:
+            return sum(t.state in ("done", "failed") for t in self._tasks.values()), len(self._tasks)
+
+    def stage_timings(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-stage summary, grouping tasks by the prefix before ':'
+        ("image:03" -> "image"): wall time from first start to last end,
+        summed busy time, and task count.
+        """
+        out: Dict[str, Dict[str, float]] = {}
+        groups: Dict[str, List[Tuple[float, float]]] = {}
+        for name, span in self.timings.items():
+            groups.setdefault(name.split(":", 1)[0], []).append(span)
+        for stage, spans in groups.items():
+            out[stage] = {
+                "wall_s": round(max(e for _, e in spans) - min(s for s, _ in spans), 3),
+                "busy_s": round(sum(e - s for s, e in spans), 3),
+                "tasks": len(spans),
+            }
+        return out
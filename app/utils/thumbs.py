@@ -0,0 +1,59 @@
+# app/utils/thumbs.py
+from __future__ import annotations
+import os, threading
+from pathlib import Path
+from typing import Dict, Optional
+
+# Pre-sized WebP renditions kept next to the original: cover.png -> cover.thumb.webp, cover.preview.webp.
+# Widths are ~1.5x the on-screen size (Library card ~250 px, Read page 520 px) so hi-DPI stays sharp.
+RENDITIONS = {
+    "thumb": int(os.getenv("THUMB_WIDTH", "384")),
+    "preview": int(os.getenv("PREVIEW_WIDTH", "768")),
+}
+WEBP_QUALITY = int(os.getenv("THUMB_WEBP_QUALITY", "80"))
+
+def rendition_path(src: Path, name: str) -> Path:
+    return src.with_name(f"{src.stem}.{name}.webp")
+
+def make_renditions(src: Path, force: bool = False) -> Dict[str, str]:
+    """
+    Write the WebP renditions of one image (skipping ones already on disk
+    unless force). Returns {name: path} for the renditions that exist;
+    empty if the image can't be read or Pillow has no WebP support.
+    """
+    from PIL import Image
+
+    src = Path(src)
+    out: Dict[str, str] = {}
+    try:
+        with Image.open(src) as im:
+            im.load()
+            if im.mode not in ("RGB", "RGBA"):
+                im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+            for name, width in sorted(RENDITIONS.items(), key=lambda kv: kv[1]):
+                dest = rendition_path(src, name)
+                if force or not dest.exists():
+                    small = im.copy()
+                    small.thumbnail((width, width * 4), Image.LANCZOS)     # keep aspect, never upscale
+                    tmp = dest.with_name(f"{dest.name}.{os.getpid()}.{threading.get_ident()}.part")
+                    small.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+                    os.replace(tmp, dest)
+                out[name] = str(dest)
+    except Exception as e:
+        print(f"[thumbs] Could not make renditions for {src}: {e}")
+    return out
+
+def best_image(path: Optional[str], width: int) -> Optional[str]:
+    """
+    Smallest rendition of `path` at least `width` px wide, falling back to
+    the original when none fits (or none were made).
+    """
+    if not path:
+        return path
+    src = Path(path)
+    for name, w in sorted(RENDITIONS.items(), key=lambda kv: kv[1]):
+        if w >= width:
+            candidate = rendition_path(src, name)
+            if candidate.exists():
+                return str(candidate)
+    return path